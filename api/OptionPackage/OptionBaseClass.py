@@ -1,20 +1,33 @@
+import copy
 import numpy as np
 from scipy.stats import norm
-import yfinance as yf
+
+from .market_data import get_history
+from .volatility import volatility_service
 
 
 # Define the option base class, on which we will build the rest
 # Define the option base class, on which we will build the rest
 class Option:
-    def __init__(self, S0, K, T, r, sigma, ticker=None):
+    # Contracts are slotted, and the price history is shared per ticker, so a large book
+    # costs a few hundred bytes per leg
+    __slots__ = ("S0", "K", "T", "r", "sigma", "ticker", "history")
+
+    # Whether price and greeks accept an array of spots in S0
+    supports_arrays = False
+
+    def __init__(self, S0, K, T, r, sigma, ticker=None, lazy=False):
         self.S0 = S0  # Initial stock price
         self.K = K    # Strike price
         self.T = T    # Time to maturity
         self.r = r    # Risk-free rate
         self.sigma = sigma  # Volatility
         self.ticker = ticker
+        self.history = None  # Shared PriceHistory of the ticker
 
-        if ticker:
+        # A lazy option leaves S0 and sigma unset until bind_market is called, so a
+        # portfolio can fetch the data of all its tickers at once
+        if ticker and not lazy:
             try:
                 self.fetch_data(ticker)
                 self.calculate_volatility()
@@ -23,13 +36,28 @@ class Option:
             
 
     def fetch_data(self, ticker):
-        stock_data = yf.download(ticker, period='1y')
-        self.S0 = stock_data['Close'].iloc[-1]
-        self.stock_data = stock_data['Close']
+        # One year of closes, downloaded once per ticker and shared with every option on it
+        self.history = get_history(ticker)
+        self.S0 = self.history.last_close
+
+    @property
+    def needs_market(self):
+        # Whether the option has a ticker whose data was not fetched yet
+        return bool(self.ticker) and self.history is None
+
+    def bind_market(self, history):
+        # Take the spot and volatility from an already fetched price history
+        self.history = history
+        self.S0 = history.last_close
+        self.calculate_volatility()
+
+    @property
+    def stock_data(self):
+        return self.history.closes
 
     def calculate_volatility(self):
-        log_returns = np.log(self.stock_data / self.stock_data.shift(1)).dropna()
-        self.sigma = np.std(log_returns) * np.sqrt(252)  # Annualize the volatility
+        # Annualized volatility of the ticker, from its estimator kept up to date bar by bar
+        self.sigma = volatility_service.volatility(self.history)
 
     def d1(self):
         return (np.log(self.S0 / self.K) + (self.r + 0.5 * self.sigma ** 2) * self.T) / (self.sigma * np.sqrt(self.T))
@@ -61,6 +89,44 @@ class Option:
     def rho(self):
         raise NotImplementedError("Subclasses should implement this method")
 
+    def _bumped(self, **changes):
+        # Shallow copy of the contract with some parameters changed, without going
+        # through the constructor (and so without refetching market data)
+        clone = copy.copy(self)
+        for name, value in changes.items():
+            setattr(clone, name, value)
+        return clone
+
+    def evaluate(self):
+        """
+        Price and greeks of the option in a single call.
+
+        Flavours with closed forms override this to share intermediates; this fallback
+        uses the first-order greek methods and bumps a copy of the contract for vanna
+        (dDelta/dsigma), volga (d2V/dsigma2) and charm (dDelta/dt, per year).
+
+        :return: A dict with price, delta, gamma, theta, vega, rho, vanna, volga and charm
+        """
+        d_sigma = 0.01
+        d_T = 1/365
+        price = self.price()
+        delta = self.delta()
+        sigma_up = self._bumped(sigma=self.sigma + d_sigma)
+        sigma_down = self._bumped(sigma=self.sigma - d_sigma)
+        later = self._bumped(T=self.T - d_T)
+
+        return {
+            "price": price,
+            "delta": delta,
+            "gamma": self.gamma(),
+            "theta": self.theta(),
+            "vega": self.vega(),
+            "rho": self.rho(),
+            "vanna": (sigma_up.delta() - sigma_down.delta()) / (2 * d_sigma),
+            "volga": (sigma_up.price() - 2 * price + sigma_down.price()) / (d_sigma ** 2),
+            "charm": (later.delta() - delta) / d_T,
+        }
+
 
 
 
@@ -1,119 +1,448 @@
+import asyncio
 import plotly.graph_objects as go
 from .option_definitions import VanillaOption, BarrierOption, AsianOption, AmericanOption
 from .OptionPositionClass import OptionPosition
+from .portfolio_store import BARRIER_TYPES, PortfolioStore
+from .surface_cache import SurfaceCache, contract_key
+from .market_data import fetch_histories, get_histories
 import numpy as np
 
+# The measures returned by OptionPosition.evaluate and OptionPortfolio.risk_report
+RISK_MEASURES = ("value", "delta", "gamma", "theta", "vega", "rho", "vanna", "volga", "charm")
+
+# The curves OptionPortfolio.evaluate_grid can return, and the ones the plots share
+GRID_MEASURES = RISK_MEASURES + ("payoff",)
+PLOT_MEASURES = ("value", "payoff", "delta", "gamma")
+
+# Flavour of each option class in the columnar store
+FLAVOUR_OF = {VanillaOption: "vanilla", BarrierOption: "barrier", AsianOption: "asian", AmericanOption: "american"}
+
+# Approximate memory of one position and its option, see benchmarks/leg_memory.py, and of
+# the greeks kept per contract
+POSITION_BYTES = 256
+CONTRACT_BYTES = 256
+
+
+
+def position_from_dict(position_dict):
+    """
+    A position from the dict format of the front end, with its market data left unbound.
+
+    Every field is checked, so a bad position raises before it reaches a portfolio.
+
+    :param position_dict: The position dict
+    :return: The OptionPosition
+    :raises ValueError: On an unknown flavour, option, position or barrier type, or a
+                        field that is not a number
+    :raises KeyError: On a missing field
+    """
+    # Extract the info from the position dictionary
+    option_flavour = position_dict["option_flavour"]
+    option_type = position_dict["option_type"]
+    strike_price = float(position_dict["strike_price"])
+    quantity = int(position_dict["quantity"])
+    position = position_dict["position"]
+    underlying_ticker = position_dict["underlying_ticker"]
+    barrier = float(position_dict["barrier_level"]) if position_dict["barrier_level"] else None
+    barrier_type = position_dict["barrier_type"]
+
+    if option_flavour == "vanilla":
+        option = VanillaOption(S0=None, K=strike_price, T=1, r=0.05, sigma=None, option_type=option_type, ticker=underlying_ticker, lazy=True)
+    elif option_flavour == "barrier":
+        option = BarrierOption(S0=None, K=strike_price, T=1, r=0.05, sigma=None, H = barrier, barrier_type = barrier_type, option_type=option_type, ticker=underlying_ticker, lazy=True)
+    elif option_flavour == "asian":
+        option = AsianOption(S0 = None, K = strike_price, T=1, r=0.05, sigma=None, option_type=option_type, asian_type="geometric", ticker = underlying_ticker, lazy=True)
+    elif option_flavour == "american":
+        option = AmericanOption(S0 = None, K = strike_price, T=1, r=0.05, sigma=None, option_type=option_type, ticker = underlying_ticker, lazy=True)
+    else:
+        raise ValueError(f"Unknown option flavour {option_flavour}")
+
+    # The same checks as the store, before anything is added
+    if option.option_type not in ("call", "put"):
+        raise ValueError(f"Unknown option type {option_type}")
+    if position not in ("long", "short"):
+        raise ValueError(f"Unknown position {position}")
+    if getattr(option, "barrier_type", None) not in (None,) + BARRIER_TYPES:
+        raise ValueError(f"Unknown barrier type {barrier_type}")
+    return OptionPosition(option, position, quantity)
+
+
 # this is the class that will calculate the properties of the portfolio
 class OptionPortfolio:
-    def __init__(self, positions_dict=None):
+    def __init__(self, positions_dict=None, surface_cache=None):
         self.positions = []
-        self.dictionary = []
+        # Columnar copy of the legs, row i is self.positions[i]
+        self.store = PortfolioStore()
+        self._reset_totals()
+        self._invalidate()
+        # Optional SurfaceCache for the value, delta and gamma curves of the non-vanilla legs
+        self.surface_cache = surface_cache
         if positions_dict is not None and len(positions_dict)>0:
+            # The legs are bound to market data together, on the first evaluation
             for pos in positions_dict:
-                self.add_position_dict(pos)
+                self.add_position_dict(pos, lazy=True)
+
+    @property
+    def dictionary(self):
+        # The positions in the dict format exchanged with the front end
+        return self.store.to_dicts()
+
+    @property
+    def nbytes(self):
+        # Approximate memory held by the book: positions, store, unit greeks and cached curves
+        grids = sum(curve.nbytes for curves in self._grids.values() for curve in curves.values())
+        return (POSITION_BYTES * len(self.positions) + self.store.nbytes
+                + CONTRACT_BYTES * len(self._unit_greeks) + grids)
 
     def empty_portfolio(self):
         self.positions = []
-        self.dictionary = []
+        self.store.clear()
+        self._reset_totals()
+        self._invalidate()
 
         return "Emptied portfolio"
 
 
-    def add_position_dict(self, position_dict):
-        # Add the position to the dictionary
-        self.dictionary.append(position_dict)
-
-        # Extract the info from the position dictionary
+    def add_position_dict(self, position_dict, lazy=False):
+        try:
+            option_position = position_from_dict(position_dict)
+        except ValueError as error:
+            return str(error)
+        option = option_position.option
         option_flavour = position_dict["option_flavour"]
-        option_type = position_dict["option_type"]
-        strike_price = float(position_dict["strike_price"])
-        quantity = int(position_dict["quantity"])
-        position = position_dict["position"]
-        underlying_ticker = position_dict["underlying_ticker"]
-        barrier = float(position_dict["barrier_level"]) if position_dict["barrier_level"] else None
-        barrier_type = position_dict["barrier_type"]
-
-    
-        if option_flavour == "vanilla":
-            option = VanillaOption(S0=None, K=strike_price, T=1, r=0.05, sigma=None, option_type=option_type, ticker=underlying_ticker)
-            option_position = OptionPosition(option, position, quantity)
-            self.add_position(option_position)
-            print(f"Added {quantity} {option_flavour} to the portfolio, the underlying stock: {underlying_ticker} has price ${option.S0} and calculated volatility of {option.sigma}")
-            return f"Added {quantity} {option_flavour} to the portfolio, the underlying stock: {underlying_ticker} has price ${option.S0} and calculated volatility of {option.sigma}"
-        
-        if option_flavour == "barrier":
-            barrier_option = BarrierOption(S0=None, K=strike_price, T=1, r=0.05, sigma=None, H = barrier, barrier_type = barrier_type, option_type=option_type, ticker=underlying_ticker)
-            option_position = OptionPosition(barrier_option, position, quantity)
-            self.add_position(option_position)
-            print(f"Added {quantity} {option_flavour} to the portfolio, the underlying stock: {underlying_ticker} has price ${option.S0} and calculated volatility of {option.sigma}")
-            return f"Added {quantity} {option_flavour} to the portfolio, the underlying stock: {underlying_ticker} has price ${option.S0} and calculated volatility of {option.sigma}"
-
-
-        if option_flavour == "asian":
-            asian_option = AsianOption(S0 = None, K = strike_price, T=1, r=0.05, sigma=None, option_type=option_type, asian_type="geometric", ticker = underlying_ticker)
-            option_position = OptionPosition(asian_option, position, quantity)
-            self.add_position(option_position)
-            print(f"Added {quantity} {option_flavour} to the portfolio, the underlying stock: {underlying_ticker} has price ${option.S0} and calculated volatility of {option.sigma}")
-            return f"Added {quantity} {option_flavour} to the portfolio, the underlying stock: {underlying_ticker} has price ${option.S0} and calculated volatility of {option.sigma}"
-
-        
-        if option_flavour == "american":
-            american_option = AmericanOption(S0 = None, K = strike_price, T=1, r=0.05, sigma=None, option_type=option_type, ticker = underlying_ticker)
-            option_position = OptionPosition(american_option, position, quantity)
-            self.add_position(option_position)
-            print(f"Added {quantity} {option_flavour} to the portfolio, the underlying stock: {underlying_ticker} has price ${option.S0} and calculated volatility of {option.sigma}")
-            return f"Added {quantity} {option_flavour} to the portfolio, the underlying stock: {underlying_ticker} has price ${option.S0} and calculated volatility of {option.sigma}"
+        quantity = option_position.quantity
+        underlying_ticker = option.ticker
+        self.add_position(option_position)
+        if lazy:
+            return f"Added {quantity} {option_flavour} to the portfolio, the underlying stock: {underlying_ticker}"
+
+        try:
+            self._bind()
+        except ValueError as error:
+            # Without its market data the new leg is not added; other legs still unbound
+            # stay in the book and are tried again at the next access
+            if option.needs_market:
+                self.remove_position(option_position)
+                print(error)
+                return str(error)
+        print(f"Added {quantity} {option_flavour} to the portfolio, the underlying stock: {underlying_ticker} has price ${option.S0} and calculated volatility of {option.sigma}")
+        return f"Added {quantity} {option_flavour} to the portfolio, the underlying stock: {underlying_ticker} has price ${option.S0} and calculated volatility of {option.sigma}"
 
     def add_position(self, position):
+        # The store checks the leg and raises before anything changes, so a rejected leg
+        # leaves the positions, the store and the totals lined up
+        option = position.option
+        self.store.append(FLAVOUR_OF[type(option)], option.option_type, option.K, option.T, option.r, option.sigma,
+                          option.S0, position.signed_quantity, H=getattr(option, "H", None),
+                          barrier_type=getattr(option, "barrier_type", None), ticker=option.ticker)
         self.positions.append(position)
+        self._net_in(position)
+        if option.needs_market:
+            self._unbound.append(position)
+        # The leg joins the running totals when they are next read
+        self._contributions.append(None)
+        self._pending.append(len(self.positions) - 1)
+        self._invalidate()
 
     def remove_position(self, position):
-        self.positions.remove(position)
+        row = self.positions.index(position)
+        del self.positions[row]
+        self.store.remove(row)
+        if position in self._unbound:
+            self._unbound.remove(position)
+        self._net_out(self._keys.pop(row), position.option, position.signed_quantity)
+
+        contribution = self._contributions.pop(row)
+        if contribution is None:
+            self._pending.remove(row)
+        else:
+            self._totals -= contribution
+        self._pending = [i - 1 if i > row else i for i in self._pending]
+        if not self.positions:
+            self._reset_totals()
+        self._invalidate()
+
+    def update_market(self, ticker, S0=None, sigma=None):
+        """
+        Move the legs on one underlying to a new market snapshot.
+
+        Only these legs leave the running totals and are priced again when the totals are
+        next read, the rest of the book keeps its contributions.
+
+        :param ticker: The underlying ticker
+        :param S0: The new spot price, or None to keep it
+        :param sigma: The new volatility, or None to keep it
+        :return: The number of legs that were updated
+        """
+        rows = [row for row, position in enumerate(self.positions) if position.option.ticker == ticker]
+        for row in rows:
+            option = self.positions[row].option
+            if S0 is not None:
+                option.S0 = S0
+            if sigma is not None:
+                option.sigma = sigma
+            self._move_leg(row)
+        if rows:
+            self._invalidate()
+        return len(rows)
+
+    def _move_leg(self, row):
+        # After the market inputs of a leg's option changed: copy them to the store,
+        # net the leg under its new key and price it again at the next read
+        position = self.positions[row]
+        option = position.option
+        self.store.S0[row] = np.nan if option.S0 is None else option.S0
+        self.store.sigma[row] = np.nan if option.sigma is None else option.sigma
+        self._net_out(self._keys[row], option, position.signed_quantity)
+        self._keys[row] = self._net_key(option)
+        self._net_add(self._keys[row], option, position.signed_quantity)
+
+        if self._contributions[row] is not None:
+            self._totals -= self._contributions[row]
+            self._contributions[row] = None
+            self._pending.append(row)
+
+    def _bind(self):
+        # Fetch the market data of the legs added lazily, one batched download for all
+        # their tickers, and move the legs to it. Legs whose ticker failed stay unbound,
+        # so the next access tries again, and the errors are raised as a ValueError
+        if not self._unbound:
+            return
+        unbound, self._unbound = self._unbound, []
+        histories, errors = get_histories([position.option.ticker for position in unbound])
+
+        rows = {id(position): row for row, position in enumerate(self.positions)}
+        for position in unbound:
+            history = histories.get(position.option.ticker)
+            if history is None:
+                self._unbound.append(position)
+            else:
+                position.option.bind_market(history)
+                self._move_leg(rows[id(position)])
+        self._invalidate()
+        if errors:
+            raise ValueError("Error fetching data for ticker: "
+                             + ", ".join(f"{ticker} ({error})" for ticker, error in errors.items()))
+
+    # Netting: identical contracts (same flavour, terms, market inputs and ticker) are
+    # merged into one entry with the net signed quantity, and fully offset ones dropped.
+    # The positions list stays as entered, all pricing runs on the unique contracts.
+
+    @staticmethod
+    def _net_key(option):
+        return contract_key(option) + (option.S0, option.ticker)
+
+    def _net_add(self, key, option, quantity):
+        entry = self._net.setdefault(key, [option, 0])
+        entry[1] += quantity
+        if entry[1] == 0:
+            del self._net[key]
+
+    def _net_in(self, position):
+        key = self._net_key(position.option)
+        self._keys.append(key)
+        self._net_add(key, position.option, position.signed_quantity)
+
+    def _net_out(self, key, option, quantity):
+        # A leg leaving its key; when its offsetting legs stay, the key comes back with
+        # the leg's option standing for them
+        self._net_add(key, option, -quantity)
+
+    async def refresh_market(self):
+        """
+        Get the market data of every ticker in the book without blocking the event loop.
+
+        Legs added lazily then bind from the cache at the next evaluation; bound legs
+        whose ticker has newer data are moved to it, and only they are priced again.
+        """
+        tickers = [position.option.ticker for position in self.positions]
+        histories, _ = await fetch_histories(tickers)
+        # Binding estimates volatilities, which may go through the shared cache tier
+        await asyncio.to_thread(self._rebind, histories)
+
+    def _rebind(self, histories):
+        moved = False
+        for row, position in enumerate(self.positions):
+            option = position.option
+            history = histories.get(option.ticker)
+            if history is not None and option.history is not None and history is not option.history:
+                option.bind_market(history)
+                self._move_leg(row)
+                moved = True
+        if moved:
+            self._invalidate()
+
+    def netted_positions(self):
+        # The book with identical contracts merged, as positions
+        self._bind()
+        return [OptionPosition(option, "long" if quantity > 0 else "short", abs(quantity))
+                for option, quantity in self._net.values()]
+
+    def _reset_totals(self):
+        # Running totals of RISK_MEASURES, with the contribution of each priced leg so it
+        # can be taken out again; legs in _pending are not priced into the totals yet.
+        # Greeks per unit of each contract are kept, so a repeated contract is not repriced.
+        self._totals = np.zeros(len(RISK_MEASURES))
+        self._contributions = []
+        self._pending = []
+        self._unit_greeks = {}
+        self._net = {}  # Contract key -> [option, net signed quantity]
+        self._keys = []  # Contract key of each position
+        self._unbound = []  # Positions whose option still has to fetch its market data
+
+    def _settle(self):
+        # Price the contracts of the pending legs that are not known yet, the vanilla ones
+        # in one batched kernel call, and add the legs to the running totals
+        self._bind()
+        if not self._pending:
+            return
+        missing = {}  # Contract key -> a row that holds it
+        for row in self._pending:
+            key = self._keys[row]
+            if key not in self._unit_greeks:
+                missing.setdefault(key, row)
+
+        vanilla_rows = set(self.store.rows_of("vanilla").tolist())
+        vanilla = [key for key, row in missing.items() if row in vanilla_rows]
+        greeks = self.store.vanilla_greeks([missing[key] for key in vanilla])
+        for i, key in enumerate(vanilla):
+            self._unit_greeks[key] = np.array([greeks[name][i] for name in RISK_MEASURES])
+        for key, row in missing.items():
+            if key not in self._unit_greeks:
+                report = self.positions[row].option.evaluate()
+                self._unit_greeks[key] = np.array([report["price" if name == "value" else name] for name in RISK_MEASURES],
+                                                  dtype=float)
+
+        for row in self._pending:
+            contribution = self.positions[row].signed_quantity * self._unit_greeks[self._keys[row]]
+            self._contributions[row] = contribution
+            self._totals += contribution
+        self._pending = []
+
+    def _invalidate(self):
+        # Drop the cached grid curves after the positions change, and unit greeks whose
+        # contracts are no longer in the book
+        self._grids = {}
+        if len(self._unit_greeks) > 2 * len(self._net) + 64:
+            self._unit_greeks = {key: greeks for key, greeks in self._unit_greeks.items() if key in self._net}
+
+    def risk_report(self):
+        # Value and all greeks of the book from the running totals, only legs added or
+        # moved to a new market snapshot since the last call are priced
+        self._settle()
+        return dict(zip(RISK_MEASURES, self._totals.tolist()))
+
+    def evaluate_grid(self, S, measures=("value", "payoff", "delta", "gamma", "theta", "vega")):
+        """
+        Curves of the book over a spot grid, without changing any position.
+
+        Runs on the netted book: the vanilla contracts are one batched kernel call, every
+        other contract is evaluated once on a copy of its option with the spot set to the
+        grid, so all the requested curves share one evaluation. The latest results are
+        kept until the positions change.
+
+        :param S: The spot grid
+        :param measures: Any of "payoff" and the RISK_MEASURES
+        :return: A dict with an array of the shape of S per measure
+        """
+        S = np.asarray(S, dtype=float)
+        measures = tuple(measures)
+        unknown = set(measures) - set(GRID_MEASURES)
+        if unknown:
+            raise ValueError(f"Unknown measures: {sorted(unknown)}")
+
+        self._bind()
+        key = (S.shape, S.tobytes(), measures)
+        if key in self._grids:
+            return self._grids[key]
+
+        netted = self.netted_positions()
+        others = [position for position in netted if type(position.option) is not VanillaOption]
+
+        curves = {}
+        greeks = [name for name in measures if name != "payoff"]
+        if greeks:
+            # The vanilla legs from the store columns, netted on their terms alone since
+            # the spot comes from the grid
+            rows, quantity = self.store.net(self.store.rows_of("vanilla"))
+            totals = self.store.vanilla_greeks(rows, S)
+            curves = {name: totals[name] @ quantity for name in greeks}
+            spot_only = set(greeks) <= set(SurfaceCache.DERIVATIVES)
+            for position in others:
+                if self.surface_cache is not None and spot_only:
+                    leg = {name: position.signed_quantity * self.surface_cache.evaluate(position.option, S, name)
+                           for name in greeks}
+                else:
+                    leg = position.evaluate_at(S, greeks)
+                for name in greeks:
+                    curves[name] = curves[name] + leg[name]
+        if "payoff" in measures:
+            curves["payoff"] = sum((position.payoff(S) for position in netted), np.zeros(S.shape))
+
+        if len(self._grids) >= 16:
+            self._grids.pop(next(iter(self._grids)))
+        self._grids[key] = curves
+        return curves
+
+    def _curve(self, S, name):
+        curve = self.evaluate_grid(S, (name,))[name]
+        return curve[()] if np.ndim(curve) == 0 else curve
+
+    def risk_by_ticker(self):
+        # Value and greeks per underlying, summed from the leg contributions of the totals
+        self._settle()
+        report = self.store.sum_by_ticker(np.reshape(self._contributions, (-1, len(RISK_MEASURES))))
+        return {ticker: dict(zip(RISK_MEASURES, totals.tolist())) for ticker, totals in report.items()}
 
     def total_value(self):
-        return sum(position.value() for position in self.positions)
+        return self.risk_report()["value"]
 
     def total_value_at(self, S):
-        return sum(position.value_at(S) for position in self.positions)
+        return self._curve(S, "value")
 
     def total_delta(self):
-        return sum(position.delta() for position in self.positions)
+        return self.risk_report()["delta"]
 
     def total_delta_at(self, S):
-        return sum(position.delta_at(S) for position in self.positions)
+        return self._curve(S, "delta")
 
     def total_gamma(self):
-        return sum(position.gamma() for position in self.positions)
+        return self.risk_report()["gamma"]
 
     def total_gamma_at(self, S):
-        return sum(position.gamma_at(S) for position in self.positions)
+        return self._curve(S, "gamma")
 
     def total_theta(self):
-        return sum(position.theta() for position in self.positions)
+        return self.risk_report()["theta"]
 
     def total_vega(self):
-        return sum(position.vega() for position in self.positions)
+        return self.risk_report()["vega"]
 
     def total_rho(self):
-        return sum(position.rho() for position in self.positions)
+        return self.risk_report()["rho"]
 
     
     def S_range(self):
         # Find the min and max S0 in the portfolio
-        min_S0 = min(pos.option.S0 for pos in self.positions)
-        max_S0 = max(pos.option.S0 for pos in self.positions)
+        self._bind()
+        min_S0 = np.min(self.store.S0)
+        max_S0 = np.max(self.store.S0)
 
         # Set a range around these values
         S_range = np.linspace(min_S0 * 0.1, max_S0 * 3, 50)
 
         return S_range
 
+    def plot_curves(self, S_range):
+        # All plotted curves come from one cached grid evaluation
+        return self.evaluate_grid(S_range, PLOT_MEASURES)
+
     def payoff(self, S):
-        return sum(position.payoff(S) for position in self.positions)
+        return self._curve(S, "payoff")
 
     def plot_payoff(self, return_html = False):
         S_range = self.S_range()
-        payoffs = [self.payoff(S) for S in S_range]
+        payoffs = self.plot_curves(S_range)["payoff"]
 
         layout = go.Layout(
             title='Dark Theme Example',
@@ -150,7 +479,7 @@ class OptionPortfolio:
 
     def plot_value(self, return_html = False):
         S_range = self.S_range()
-        portfolio_values = [self.total_value_at(S) for S in S_range]
+        portfolio_values = self.plot_curves(S_range)["value"]
 
         layout = go.Layout(
             title='Dark Theme Example',
@@ -187,7 +516,7 @@ class OptionPortfolio:
 
     def plot_delta(self, return_html = False):
         S_range = self.S_range()
-        portfolio_delta = [self.total_delta_at(S) for S in S_range]
+        portfolio_delta = self.plot_curves(S_range)["delta"]
 
         layout = go.Layout(
             title='Dark Theme Example',
@@ -223,7 +552,7 @@ class OptionPortfolio:
 
     def plot_gamma(self, return_html = False):
         S_range = self.S_range()
-        portfolio_gamma = [self.total_gamma_at(S) for S in S_range]
+        portfolio_gamma = self.plot_curves(S_range)["gamma"]
 
         layout = go.Layout(
             title='Dark Theme Example',
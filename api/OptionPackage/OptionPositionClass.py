@@ -1,44 +1,82 @@
+import numpy as np
+
+# Option method behind each first-order measure
+FIRST_ORDER_METHODS = {"value": "price", "delta": "delta", "gamma": "gamma", "theta": "theta", "vega": "vega", "rho": "rho"}
+
 # Define the option position class, which stores the number of options and long-short positions
 class OptionPosition:
+    __slots__ = ("option", "position", "quantity")
+
     def __init__(self, option, position="long", quantity=1):
         self.option = option
         self.position = position
         self.quantity = quantity
 
+    @property
+    def signed_quantity(self):
+        multiplier = 1 if self.position == "long" else -1
+        return multiplier * self.quantity
+
+    def evaluate(self):
+        # Value and all greeks of the position from one evaluation of the option
+        greeks = self.option.evaluate()
+        return {("value" if name == "price" else name): self.signed_quantity * greek for name, greek in greeks.items()}
+
+    def evaluate_at(self, S, measures=None):
+        """
+        Value and greeks of the position with the spot moved to S.
+
+        :param S: Spot price or array of spots
+        :param measures: Names of the measures wanted, all of evaluate by default. When
+                         they are all first-order ones only those methods are called.
+        :return: A dict like evaluate, with arrays of the shape of S
+        """
+        if measures is None or not set(measures) <= set(FIRST_ORDER_METHODS):
+            def evaluate(option):
+                greeks = option.evaluate()
+                return {("value" if name == "price" else name): greek for name, greek in greeks.items()}
+        else:
+            def evaluate(option):
+                return {name: getattr(option, FIRST_ORDER_METHODS[name])() for name in measures}
+
+        option = self.option
+        if np.ndim(S) == 0 or option.supports_arrays:
+            greeks = evaluate(option._bumped(S0=S))
+        else:
+            # Flavours without array support are evaluated point by point
+            points = [evaluate(option._bumped(S0=s)) for s in np.ravel(S)]
+            greeks = {name: np.reshape([point[name] for point in points], np.shape(S)) for name in points[0]}
+        return {name: self.signed_quantity * greek for name, greek in greeks.items()}
+
     def value(self):
         multiplier = 1 if self.position == "long" else -1
         return multiplier * self.quantity * self.option.price()
 
-    def value_at(self, S):
-        # Temporarily change the stock price to compute the value
-        original_price = self.option.S0
-        self.option.S0 = S
-        value = self.value()
-        self.option.S0 = original_price  # Reset the stock price
-        return value
+    def value_at(self, S, surface_cache=None):
+        # With a SurfaceCache the value comes off the cached price surface of the contract,
+        # otherwise a copy of the option is priced at S, the option itself is left alone
+        if surface_cache is not None:
+            return self.signed_quantity * surface_cache.evaluate(self.option, S, "value")
+        return self.signed_quantity * self.option._bumped(S0=S).price()
 
     def delta(self):
         multiplier = 1 if self.position == "long" else -1
         return multiplier * self.quantity * self.option.delta()
 
 
-    def delta_at(self, S):
-        original_price = self.option.S0
-        self.option.S0 = S
-        delta = self.delta()
-        self.option.S0 = original_price  # Reset the stock price
-        return delta
+    def delta_at(self, S, surface_cache=None):
+        if surface_cache is not None:
+            return self.signed_quantity * surface_cache.evaluate(self.option, S, "delta")
+        return self.signed_quantity * self.option._bumped(S0=S).delta()
 
     def gamma(self):
         multiplier = 1 if self.position == "long" else -1
         return multiplier * self.quantity * self.option.gamma()
 
-    def gamma_at(self, S):
-        original_price = self.option.S0
-        self.option.S0 = S
-        gamma = self.gamma()
-        self.option.S0 = original_price  # Reset the stock price
-        return gamma
+    def gamma_at(self, S, surface_cache=None):
+        if surface_cache is not None:
+            return self.signed_quantity * surface_cache.evaluate(self.option, S, "gamma")
+        return self.signed_quantity * self.option._bumped(S0=S).gamma()
 
     def theta(self):
         multiplier = 1 if self.position == "long" else -1
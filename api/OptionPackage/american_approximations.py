@@ -0,0 +1,215 @@
+import numpy as np
+
+from .black_scholes import black_scholes, norm_cdf, norm_pdf
+from .lattice import binomial_tree
+
+
+# Closed-form approximations for American options on a non-dividend-paying stock.
+# Without dividends and with a positive rate an American call is never exercised early,
+# so both functions return the Black-Scholes price for calls and only approximate the
+# puts. At a zero rate neither flavour is exercised early; below zero the puts are not,
+# while the calls are priced on a Leisen-Reimer tree, as the formulas need r > 0.
+# All inputs may be arrays and are broadcast against each other.
+
+LATTICE_STEPS = 200  # Steps of the tree for the calls at negative rates
+
+
+def _broadcast(S, K, T, r, sigma, is_call):
+    return np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (S, K, T, r, sigma)), np.asarray(is_call, dtype=bool))
+
+
+def _non_positive_rates(price, S, K, T, r, sigma, is_call, european):
+    # The prices where r <= 0: European, except the calls at a negative rate, which go on
+    # an extrapolated Leisen-Reimer tree
+    price = np.where(r <= 0, european, price)
+    tree = is_call & (r < 0)
+    if np.any(tree):
+        params = (S[tree], K[tree], T[tree], r[tree], sigma[tree], True)
+        coarse = binomial_tree(*params, steps=LATTICE_STEPS, method="leisen-reimer")
+        fine = binomial_tree(*params, steps=2 * LATTICE_STEPS + 1, method="leisen-reimer")
+        price = np.array(price)
+        price[tree] = 2 * fine - coarse
+    return price
+
+
+def _unwrap(x):
+    return x[()] if np.ndim(x) == 0 else x
+
+
+def barone_adesi_whaley(S, K, T, r, sigma, is_call=True, max_iterations=100, accuracy=1e-8):
+    """
+    Barone-Adesi and Whaley (1987) quadratic approximation.
+
+    :param S: Spot price(s) of the underlying
+    :param K: Strike price(s)
+    :param T: Time(s) to maturity in years
+    :param r: Risk-free rate(s)
+    :param sigma: Volatility(ies)
+    :param is_call: Boolean flag(s), True for calls and False for puts
+    :param max_iterations: Cap on the Newton iterations for the critical price
+    :param accuracy: Relative accuracy of the critical price
+    :return: The option price(s)
+    """
+    S, K, T, r_in, sigma, is_call = _broadcast(S, K, T, r, sigma, is_call)
+    european = black_scholes(S, K, T, r_in, sigma, is_call)["price"]
+    # The formula needs r > 0, other rates get a placeholder and are priced after
+    r = np.where(r_in > 0, r_in, 0.05)
+
+    sigma_sqrt_T = sigma * np.sqrt(T)
+    discount = np.exp(-r * T)
+    n = 2 * r / sigma ** 2
+    k = n / (1 - discount)
+    q1 = (-(n - 1) - np.sqrt((n - 1) ** 2 + 4 * k)) / 2
+
+    # Seed the critical price from the perpetual put, then Newton on
+    # K - S* = P(S*) - (1 - N(-d1(S*))) S* / q1
+    q1_perpetual = (-(n - 1) - np.sqrt((n - 1) ** 2 + 4 * n)) / 2
+    S_perpetual = K / (1 - 1 / q1_perpetual)
+    h1 = (r * T - 2 * sigma_sqrt_T) * K / (K - S_perpetual)
+    S_star = S_perpetual + (K - S_perpetual) * np.exp(h1)
+
+    for _ in range(max_iterations):
+        d1 = (np.log(S_star / K) + (r + 0.5 * sigma ** 2) * T) / sigma_sqrt_T
+        put = black_scholes(S_star, K, T, r, sigma, False)["price"]
+        rhs = put - (1 - norm_cdf(-d1)) * S_star / q1
+        slope = -norm_cdf(-d1) * (1 - 1 / q1) - (1 + norm_pdf(d1) / sigma_sqrt_T) / q1
+        converged = np.abs(K - S_star - rhs) / K < accuracy
+        if np.all(converged):
+            break
+        S_star = np.where(converged, S_star, (K - rhs + slope * S_star) / (1 + slope))
+
+    d1 = (np.log(S_star / K) + (r + 0.5 * sigma ** 2) * T) / sigma_sqrt_T
+    A1 = -(S_star / q1) * (1 - norm_cdf(-d1))
+    put = np.where(S > S_star, european + A1 * (S / S_star) ** q1, K - S)
+
+    price = np.where(is_call, european, put)
+    return _unwrap(_non_positive_rates(price, S, K, T, r_in, sigma, is_call, european))
+
+
+def bivariate_norm_cdf(a, b, rho):
+    # P(X < a, Y < b) for standard normals with correlation rho, |rho| < 0.925.
+    # Genz (2004): integrate Plackett's identity dP/drho = phi2 over asin(rho)
+    # with 20-point Gauss-Legendre, which is exact to double precision there.
+    a, b, rho = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (a, b, rho)))
+    if np.any(np.abs(rho) >= 0.925):
+        raise ValueError("Correlation too large for the Gauss-Legendre bivariate normal")
+
+    nodes, weights = np.polynomial.legendre.leggauss(20)
+    h, k = -a[..., np.newaxis], -b[..., np.newaxis]
+    asr = np.arcsin(rho)[..., np.newaxis]
+    sn = np.sin(asr * (1 + nodes) / 2)
+    integrand = np.exp((sn * h * k - (h * h + k * k) / 2) / (1 - sn * sn))
+    upper = (integrand @ weights) * asr[..., 0] / (4 * np.pi) + norm_cdf(a) * norm_cdf(b)
+    # The integral gives P(X > -a, Y > -b), the same as P(X < a, Y < b) by symmetry
+    return upper
+
+
+def _phi(S, T, gamma, H, I, r, b, sigma):
+    sigma_sqrt_T = sigma * np.sqrt(T)
+    lmbda = (-r + gamma * b + 0.5 * gamma * (gamma - 1) * sigma ** 2) * T
+    d = -(np.log(S / H) + (b + (gamma - 0.5) * sigma ** 2) * T) / sigma_sqrt_T
+    kappa = 2 * b / sigma ** 2 + 2 * gamma - 1
+    return np.exp(lmbda) * S ** gamma * (norm_cdf(d) - (I / S) ** kappa * norm_cdf(d - 2 * np.log(I / S) / sigma_sqrt_T))
+
+
+def _ksi(S, T2, gamma, H, I2, I1, t1, r, b, sigma):
+    drift = b + (gamma - 0.5) * sigma ** 2
+    sigma_sqrt_t1 = sigma * np.sqrt(t1)
+    sigma_sqrt_T2 = sigma * np.sqrt(T2)
+    e1 = (np.log(S / I1) + drift * t1) / sigma_sqrt_t1
+    e2 = (np.log(I2 ** 2 / (S * I1)) + drift * t1) / sigma_sqrt_t1
+    e3 = (np.log(S / I1) - drift * t1) / sigma_sqrt_t1
+    e4 = (np.log(I2 ** 2 / (S * I1)) - drift * t1) / sigma_sqrt_t1
+    f1 = (np.log(S / H) + drift * T2) / sigma_sqrt_T2
+    f2 = (np.log(I2 ** 2 / (S * H)) + drift * T2) / sigma_sqrt_T2
+    f3 = (np.log(I1 ** 2 / (S * H)) + drift * T2) / sigma_sqrt_T2
+    f4 = (np.log(S * I1 ** 2 / (H * I2 ** 2)) + drift * T2) / sigma_sqrt_T2
+    rho = np.sqrt(t1 / T2)
+    lmbda = -r + gamma * b + 0.5 * gamma * (gamma - 1) * sigma ** 2
+    kappa = 2 * b / sigma ** 2 + 2 * gamma - 1
+    return np.exp(lmbda * T2) * S ** gamma * (
+        bivariate_norm_cdf(-e1, -f1, rho)
+        - (I2 / S) ** kappa * bivariate_norm_cdf(-e2, -f2, rho)
+        - (I1 / S) ** kappa * bivariate_norm_cdf(-e3, -f3, -rho)
+        + (I1 / I2) ** kappa * bivariate_norm_cdf(-e4, -f4, -rho))
+
+
+def _bjerksund_stensland_call(S, K, T, r, b, sigma):
+    # Bjerksund and Stensland (2002) call with cost of carry b < r, two-step exercise boundary
+    t1 = 0.5 * (np.sqrt(5) - 1) * T
+    beta = (0.5 - b / sigma ** 2) + np.sqrt((b / sigma ** 2 - 0.5) ** 2 + 2 * r / sigma ** 2)
+    B_infinity = beta / (beta - 1) * K
+    B_zero = np.maximum(K, r / (r - b) * K)
+    h1 = -(b * t1 + 2 * sigma * np.sqrt(t1)) * K ** 2 / ((B_infinity - B_zero) * B_zero)
+    h2 = -(b * T + 2 * sigma * np.sqrt(T)) * K ** 2 / ((B_infinity - B_zero) * B_zero)
+    I1 = B_zero + (B_infinity - B_zero) * (1 - np.exp(h1))
+    I2 = B_zero + (B_infinity - B_zero) * (1 - np.exp(h2))
+    alpha1 = (I1 - K) * I1 ** -beta
+    alpha2 = (I2 - K) * I2 ** -beta
+
+    # Stop the spot at the boundary so the formula stays finite where exercise is immediate
+    S_c = np.minimum(S, I2)
+    price = (alpha2 * S_c ** beta
+             - alpha2 * _phi(S_c, t1, beta, I2, I2, r, b, sigma)
+             + _phi(S_c, t1, 1, I2, I2, r, b, sigma)
+             - _phi(S_c, t1, 1, I1, I2, r, b, sigma)
+             - K * _phi(S_c, t1, 0, I2, I2, r, b, sigma)
+             + K * _phi(S_c, t1, 0, I1, I2, r, b, sigma)
+             + alpha1 * _phi(S_c, t1, beta, I1, I2, r, b, sigma)
+             - alpha1 * _ksi(S_c, T, beta, I1, I2, I1, t1, r, b, sigma)
+             + _ksi(S_c, T, 1, I1, I2, I1, t1, r, b, sigma)
+             - _ksi(S_c, T, 1, K, I2, I1, t1, r, b, sigma)
+             - K * _ksi(S_c, T, 0, I1, I2, I1, t1, r, b, sigma)
+             + K * _ksi(S_c, T, 0, K, I2, I1, t1, r, b, sigma))
+    return np.where(S >= I2, S - K, price)
+
+
+def bjerksund_stensland(S, K, T, r, sigma, is_call=True):
+    """
+    Bjerksund and Stensland (2002) approximation.
+
+    :param S: Spot price(s) of the underlying
+    :param K: Strike price(s)
+    :param T: Time(s) to maturity in years
+    :param r: Risk-free rate(s)
+    :param sigma: Volatility(ies)
+    :param is_call: Boolean flag(s), True for calls and False for puts
+    :return: The option price(s)
+    """
+    S, K, T, r_in, sigma, is_call = _broadcast(S, K, T, r, sigma, is_call)
+    european = black_scholes(S, K, T, r_in, sigma, is_call)["price"]
+    r = np.where(r_in > 0, r_in, 0.05)
+
+    # Put-call transformation P(S, K, r, b) = C(K, S, r - b, -b), with b = r for no dividends
+    put = _bjerksund_stensland_call(K, S, T, np.zeros_like(r), -r, sigma)
+    # The flat two-step boundary prices a lower bound, which at low rates and long
+    # maturities can fall under the European put; that is a tighter lower bound there
+    put = np.maximum(put, european)
+
+    price = np.where(is_call, european, put)
+    return _unwrap(_non_positive_rates(price, S, K, T, r_in, sigma, is_call, european))
+
+
+def finite_difference_greeks(pricer, S, K, T, r, sigma, is_call=True):
+    # Delta, gamma and theta (per year) of a closed-form pricer from one batched call
+    # on the spot bumped by 0.1% either way and the maturity shortened by a day
+    S, K, T, r, sigma, is_call = _broadcast(S, K, T, r, sigma, is_call)
+    d_S = 1e-3 * S
+    d_T = 1/365
+    prices = pricer(S + np.array([0, 1, -1, 0]).reshape((-1,) + (1,) * S.ndim) * d_S, K,
+                    T - np.array([0, 0, 0, d_T]).reshape((-1,) + (1,) * S.ndim), r, sigma, is_call)
+    price, up, down, later = prices
+    return {
+        "price": _unwrap(price),
+        "delta": _unwrap((up - down) / (2 * d_S)),
+        "gamma": _unwrap((up - 2 * price + down) / d_S ** 2),
+        "theta": _unwrap((later - price) / d_T),
+    }
+
+
+# Closed-form engines by name
+APPROXIMATIONS = {
+    "barone-adesi-whaley": barone_adesi_whaley,
+    "bjerksund-stensland": bjerksund_stensland,
+}
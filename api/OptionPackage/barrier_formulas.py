@@ -0,0 +1,138 @@
+import numpy as np
+
+from .black_scholes import norm_cdf, norm_pdf
+
+
+# Closed-form prices and greeks of single barrier options without rebate (Reiner-Rubinstein,
+# in the form given by Hull). Every formula is a signed sum of terms
+#
+#     A(S) * N(u),   A one of S, K e^(-rT), S (H/S)^(2 lambda), K e^(-rT) (H/S)^(2 lambda - 2)
+#
+# whose arguments u are +-(x - m sigma sqrt(T)) for x one of d1, nu, eta or lambda. The greeks
+# are the analytic derivatives of the terms, so all eight barrier/type combinations get
+# exact delta, gamma, theta, vega and rho from the same table, vectorised over S, K and H.
+
+# Terms are (sign, prefactor, argument, argument sign, sigma sqrt(T) shift)
+VANILLA_CALL = ((1, "S", "d1", 1, 0), (-1, "K", "d1", 1, 1))
+VANILLA_PUT = ((-1, "S", "d1", -1, 0), (1, "K", "d1", -1, 1))
+
+DOWN_IN_CALL = ((1, "SH", "eta", 1, 0), (-1, "KH", "eta", 1, 1))
+DOWN_IN_PUT = ((-1, "S", "nu", -1, 0), (1, "K", "nu", -1, 1),
+               (1, "SH", "eta", 1, 0), (-1, "SH", "lmbda", 1, 0),
+               (-1, "KH", "eta", 1, 1), (1, "KH", "lmbda", 1, 1))
+UP_OUT_PUT = ((-1, "S", "nu", -1, 0), (1, "K", "nu", -1, 1),
+              (1, "SH", "lmbda", -1, 0), (-1, "KH", "lmbda", -1, 1))
+UP_IN_CALL = ((1, "S", "nu", 1, 0), (-1, "K", "nu", 1, 1),
+              (-1, "SH", "eta", -1, 0), (1, "SH", "lmbda", -1, 0),
+              (1, "KH", "eta", -1, 1), (-1, "KH", "lmbda", -1, 1))
+UP_IN_PUT = ((-1, "SH", "eta", -1, 0), (1, "KH", "eta", -1, 1))
+
+
+def _minus(terms):
+    return tuple((-term[0],) + term[1:] for term in terms)
+
+
+# Formulas by (barrier type, option type), as (H < K, H >= K)
+FORMULAS = {
+    ("down-and-in", "call"): (DOWN_IN_CALL, VANILLA_CALL),
+    ("down-and-out", "call"): (VANILLA_CALL + _minus(DOWN_IN_CALL), ()),
+    ("up-and-in", "call"): (VANILLA_CALL, UP_IN_CALL),
+    ("up-and-out", "call"): ((), VANILLA_CALL + _minus(UP_IN_CALL)),
+    ("down-and-in", "put"): (DOWN_IN_PUT, VANILLA_PUT),
+    ("down-and-out", "put"): (VANILLA_PUT + _minus(DOWN_IN_PUT), ()),
+    ("up-and-in", "put"): (VANILLA_PUT + _minus(UP_OUT_PUT), UP_IN_PUT),
+    ("up-and-out", "put"): (UP_OUT_PUT, VANILLA_PUT + _minus(UP_IN_PUT)),
+}
+
+MEASURES = ("price", "delta", "gamma", "theta", "vega", "rho")
+
+
+def _unwrap(x):
+    return x[()] if np.ndim(x) == 0 else x
+
+
+def _sum_terms(terms, S, K, H, T, r, sigma):
+    # Value and analytic derivatives (dS, dS2, dT, dsigma, dr) of a signed sum of terms
+    sqrt_T = np.sqrt(T)
+    s = sigma * sqrt_T
+    s_T = sigma / (2 * sqrt_T)
+    lam = r / sigma ** 2 + 0.5
+    lam_sigma = -2 * r / sigma ** 3
+    lam_r = 1 / sigma ** 2
+    log_S, log_K, log_H = np.log(S), np.log(K), np.log(H)
+    log_HS = log_H - log_S
+    discounted_strike = K * np.exp(-r * T)
+
+    # Arguments are (c ln S + L) / s + lambda s, stored as (c, L)
+    arguments = {"d1": (1, -log_K), "nu": (1, -log_H), "eta": (-1, 2 * log_H - log_K), "lmbda": (-1, log_H)}
+
+    # Prefactors A with the derivatives of log A (dS, dS2, dsigma, dr, dT)
+    zero = np.zeros_like(S)
+    power = (H / S) ** (2 * lam)
+    prefactors = {
+        "S": (S, 1 / S, -1 / S ** 2, zero, zero, zero),
+        "K": (discounted_strike + zero, zero, zero, zero, -T + zero, -r + zero),
+        "SH": (S * power, (1 - 2 * lam) / S, -(1 - 2 * lam) / S ** 2,
+               2 * lam_sigma * log_HS, 2 * lam_r * log_HS, zero),
+        "KH": (discounted_strike * power * (S / H) ** 2, -(2 * lam - 2) / S, (2 * lam - 2) / S ** 2,
+               2 * lam_sigma * log_HS, -T + 2 * lam_r * log_HS, -r + zero),
+    }
+
+    totals = {name: zero for name in MEASURES}
+    for sign, prefactor, argument, argument_sign, shift in terms:
+        c, L = arguments[argument]
+        a = c * log_S + L
+        drift = lam - shift
+        u = argument_sign * (a / s + drift * s)
+        u_S = argument_sign * c / (S * s)
+        u_SS = -argument_sign * c / (S ** 2 * s)
+        u_sigma = argument_sign * (-a * sqrt_T / s ** 2 + lam_sigma * s + drift * sqrt_T)
+        u_r = argument_sign * lam_r * s
+        u_T = argument_sign * (-a / s ** 2 + drift) * s_T
+
+        A, a_S, a_SS, a_sigma, a_r, a_T = prefactors[prefactor]
+        cdf, pdf = norm_cdf(u), norm_pdf(u)
+        signed_A = sign * A
+
+        totals["price"] = totals["price"] + signed_A * cdf
+        totals["delta"] = totals["delta"] + signed_A * (a_S * cdf + pdf * u_S)
+        totals["gamma"] = totals["gamma"] + signed_A * ((a_SS + a_S ** 2) * cdf + 2 * a_S * pdf * u_S
+                                                        + pdf * (u_SS - u * u_S ** 2))
+        # Theta is the change as calendar time passes, minus the maturity derivative
+        totals["theta"] = totals["theta"] - signed_A * (a_T * cdf + pdf * u_T)
+        totals["vega"] = totals["vega"] + signed_A * (a_sigma * cdf + pdf * u_sigma)
+        totals["rho"] = totals["rho"] + signed_A * (a_r * cdf + pdf * u_r)
+
+    return totals
+
+
+def barrier_option(S, K, H, T, r, sigma, option_type="call", barrier_type="down-and-out"):
+    """
+    Price and analytic greeks of a barrier option, vectorised over the numeric inputs.
+
+    :param S: Spot price(s) of the underlying
+    :param K: Strike price(s)
+    :param H: Barrier level(s)
+    :param T: Time(s) to maturity in years
+    :param r: Risk-free rate(s)
+    :param sigma: Volatility(ies)
+    :param option_type: "call" or "put"
+    :param barrier_type: "down-and-in", "down-and-out", "up-and-in" or "up-and-out"
+    :return: A dict of arrays with price, delta, gamma, theta (per year), vega and rho (per unit)
+    """
+    if (barrier_type, option_type) not in FORMULAS:
+        raise ValueError("Invalid barrier or option type")
+
+    S, K, H, T, r, sigma = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (S, K, H, T, r, sigma)))
+    below_strike, above_strike = FORMULAS[(barrier_type, option_type)]
+    low = _sum_terms(below_strike, S, K, H, T, r, sigma)
+    high = _sum_terms(above_strike, S, K, H, T, r, sigma)
+
+    use_low = H < K
+    if (barrier_type, option_type) == ("up-and-out", "put"):
+        # Below the strike an up-and-out put whose barrier is already under the spot is
+        # treated as the plain put
+        vanilla = _sum_terms(VANILLA_PUT, S, K, H, T, r, sigma)
+        low = {name: np.where(H <= S, vanilla[name], low[name]) for name in MEASURES}
+
+    return {name: _unwrap(np.where(use_low, low[name], high[name])) for name in MEASURES}
@@ -0,0 +1,74 @@
+import numpy as np
+from scipy.special import ndtr
+
+
+# Vectorised Black-Scholes kernel. Every input may be a scalar or a NumPy array and
+# all inputs are broadcast against each other, so a spot grid of shape (n, 1) against
+# a strike vector of shape (m,) prices the whole (n, m) block in one pass.
+
+SQRT_2PI = np.sqrt(2 * np.pi)
+
+
+def norm_pdf(x):
+    return np.exp(-0.5 * x * x) / SQRT_2PI
+
+
+def norm_cdf(x):
+    # ndtr is the raw ufunc behind norm.cdf, without the per-call argument handling
+    return ndtr(x)
+
+
+def is_call_flag(option_type):
+    # Map "call"/"put" (scalar or array of strings) to a boolean call flag
+    option_type = np.asarray(option_type)
+    if not np.all(np.isin(option_type, ("call", "put"))):
+        raise ValueError("Invalid option type")
+    return option_type == "call"
+
+
+def _unwrap(x):
+    # Hand 0-d results back as NumPy scalars, like the scalar formulas used to
+    return x[()] if np.ndim(x) == 0 else x
+
+
+def black_scholes(S, K, T, r, sigma, is_call=True):
+    """
+    Price, first- and second-order greeks of European options in one vectorised pass.
+
+    :param S: Spot price(s) of the underlying
+    :param K: Strike price(s)
+    :param T: Time(s) to maturity in years
+    :param r: Risk-free rate(s)
+    :param sigma: Volatility(ies)
+    :param is_call: Boolean flag(s), True for calls and False for puts
+    :return: A dict of arrays with price, delta, gamma, theta, vega, rho, vanna, volga and charm
+    """
+    S, K, T, r, sigma, is_call = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (S, K, T, r, sigma)), np.asarray(is_call, dtype=bool))
+
+    sqrt_T = np.sqrt(T)
+    sigma_sqrt_T = sigma * sqrt_T
+    d1 = (np.log(S / K) + (r + 0.5 * sigma ** 2) * T) / sigma_sqrt_T
+    d2 = d1 - sigma_sqrt_T
+
+    discount = np.exp(-r * T)
+    pdf_d1 = norm_pdf(d1)
+    # Signed arguments give N(d) for calls and N(-d) for puts without a second branch
+    sign = np.where(is_call, 1.0, -1.0)
+    cdf_d1 = norm_cdf(sign * d1)
+    cdf_d2 = norm_cdf(sign * d2)
+    discounted_strike = K * discount
+    vega = S * pdf_d1 * sqrt_T
+
+    return {
+        "price": _unwrap(sign * (S * cdf_d1 - discounted_strike * cdf_d2)),
+        "delta": _unwrap(sign * cdf_d1),
+        "gamma": _unwrap(pdf_d1 / (S * sigma_sqrt_T)),
+        "theta": _unwrap(-S * pdf_d1 * sigma / (2 * sqrt_T) - sign * r * discounted_strike * cdf_d2),
+        "vega": _unwrap(vega),
+        "rho": _unwrap(sign * T * discounted_strike * cdf_d2),
+        # Second-order greeks are the same for calls and puts without dividends
+        "vanna": _unwrap(-pdf_d1 * d2 / sigma),
+        "volga": _unwrap(vega * d1 * d2 / sigma),
+        "charm": _unwrap(-pdf_d1 * (2 * r * T - d2 * sigma_sqrt_T) / (2 * T * sigma_sqrt_T)),
+    }
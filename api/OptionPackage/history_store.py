@@ -0,0 +1,205 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from .market_data_providers import PERIOD_DAYS, Bars, is_valid_ticker
+
+
+# Daily bars kept on disk between restarts. Each ticker is one flat binary file of fixed
+# size rows, read through a memory map, with a small JSON file of its row count and dates.
+# A ticker seen before only needs the bars since its last stored day from the provider,
+# which are appended to its file; a full download happens once.
+# The worker processes of a host may share one directory: each ticker has a lock file,
+# taken shared to read and exclusive to write, its JSON file is replaced atomically and a
+# data file that starts over is written aside and renamed over the old one.
+
+ROW = np.dtype([("date", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8")])
+
+
+def _period_start(today, period):
+    # First day of the window a download of the period would cover, None for "max"
+    days = PERIOD_DAYS.get(period)
+    return None if days is None else today - np.timedelta64(days, "D")
+
+
+def _delta_period(days):
+    # Shortest provider period that reaches back the given number of days
+    for period, length in sorted(PERIOD_DAYS.items(), key=lambda item: item[1]):
+        if length >= days:
+            return period
+    return "max"
+
+
+def _replace(path, data):
+    # Write next to the file and rename over it, so readers never see half a file
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(data)
+    os.replace(temporary, path)
+
+
+class HistoryStore:
+    def __init__(self, directory, refresh=15 * 60):
+        """
+        :param directory: Folder of the data, metadata and lock files, created if missing
+        :param refresh: Seconds after a check during which a ticker is not asked for new bars
+        """
+        self.directory = directory
+        self.refresh = refresh
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()  # The file locks are per process, this one per thread
+
+    def _file(self, ticker, extension):
+        # Every file of a ticker is named after it, so the name must stay in the directory
+        if not is_valid_ticker(ticker):
+            raise ValueError(f"Invalid ticker {ticker!r}")
+        return os.path.join(self.directory, f"{ticker}.{extension}")
+
+    def path(self, ticker):
+        return self._file(ticker, "bin")
+
+    def entry_path(self, ticker):
+        return self._file(ticker, "json")
+
+    @contextmanager
+    def _locked(self, ticker, exclusive):
+        with open(self._file(ticker, "lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _entry(self, ticker):
+        # Row count, first and last day and time of the last check of a stored ticker
+        try:
+            with open(self.entry_path(ticker)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def _today(self):
+        return np.datetime64("today", "D")
+
+    def read(self, ticker, start=None):
+        """
+        The stored bars of a ticker, from a memory map of its file.
+
+        :param ticker: The ticker symbol
+        :param start: Only the bars after this datetime64 day, all of them by default
+        :return: Bars copied out of the file, or None if the ticker is not stored
+        """
+        with self._locked(ticker, exclusive=False):
+            entry = self._entry(ticker)
+            if entry is None or entry["rows"] == 0:
+                return None
+            rows = np.memmap(self.path(ticker), dtype=ROW, mode="r", shape=(entry["rows"],))
+            first = 0 if start is None else np.searchsorted(rows["date"], start.astype("int64"), side="right")
+            window = np.array(rows[first:])
+            del rows
+        return Bars(window["date"].astype("datetime64[D]"), window["open"].copy(), window["high"].copy(),
+                    window["low"].copy(), window["close"].copy())
+
+    def write(self, ticker, bars, since=None):
+        """
+        Add bars to a ticker's file, keeping only the ones from its last stored day on.
+
+        The last stored bar is overwritten by a newer bar of the same day, as it may have
+        been taken before the close.
+
+        :param ticker: The ticker symbol
+        :param bars: New Bars, oldest first
+        :param since: For a full download, the first day it covers ("max" for all of the
+                      history); the file is started over if that reaches further back
+        :return: The number of rows written
+        """
+        rows = np.empty(len(bars.close), dtype=ROW)
+        rows["date"] = bars.dates.astype("datetime64[D]").astype("int64")
+        for field in ("open", "high", "low", "close"):
+            rows[field] = getattr(bars, field)
+
+        with self._lock, self._locked(ticker, exclusive=True):
+            # Read again under the lock, another process may have written since
+            entry = self._entry(ticker)
+            if entry is not None and since is not None and entry["since"] != "max" and (since == "max" or since < entry["since"]):
+                entry = None
+
+            if len(rows) > 0 and entry is None:
+                _replace(self.path(ticker), rows.tobytes())
+                entry = {"since": since or str(rows["date"][0].astype("datetime64[D]")), "rows": len(rows)}
+            elif entry is None:
+                return 0
+            else:
+                last = np.datetime64(entry["last"], "D").astype("int64")
+                rows = rows[rows["date"] >= last]
+                if len(rows) > 0:
+                    # Rewrite the last stored day, append the rest
+                    offset = entry["rows"] - 1 if rows["date"][0] == last else entry["rows"]
+                    with open(self.path(ticker), "r+b") as file:
+                        file.seek(offset * ROW.itemsize)
+                        file.write(rows.tobytes())
+                    entry["rows"] = offset + len(rows)
+
+            if len(rows) > 0:
+                entry["last"] = str(rows["date"][-1].astype("datetime64[D]"))
+            entry["checked"] = time.time()
+            _replace(self.entry_path(ticker), json.dumps(entry).encode())
+            return len(rows)
+
+    def covers(self, ticker, start):
+        # Whether the stored history of a ticker is complete from the start day on
+        entry = self._entry(ticker)
+        if entry is None:
+            return False
+        return entry["since"] == "max" or (start is not None and str(start) >= entry["since"])
+
+    def fetch(self, provider, tickers, period="1y"):
+        """
+        Bars of several tickers for a period, read from disk and completed by the provider.
+
+        Tickers stored over the period only fetch the days since their last bar, grouped
+        into one provider request per delta length; the others are downloaded in full.
+
+        :param provider: The MarketDataProvider to complete the store from
+        :param tickers: The ticker symbols
+        :param period: The period of the bars, as in yfinance
+        :return: A dict of Bars per ticker over the period, tickers without data left out
+        """
+        # Symbols that cannot be stored have no data either
+        tickers = [ticker for ticker in tickers if is_valid_ticker(ticker)]
+        today = self._today()
+        start = _period_start(today, period)
+        missing = [ticker for ticker in tickers if not self.covers(ticker, start)]
+        if missing:
+            fetched = provider.fetch(missing, period)
+            for ticker, bars in fetched.items():
+                self.write(ticker, bars, since="max" if start is None else str(start))
+
+        stale = {}  # Provider period -> stored tickers to ask for their latest bars
+        for ticker in tickers:
+            entry = None if ticker in missing else self._entry(ticker)
+            if entry is not None and time.time() - entry["checked"] >= self.refresh:
+                gap = int((today - np.datetime64(entry["last"], "D")).astype(int)) + 1
+                stale.setdefault(_delta_period(gap), []).append(ticker)
+        no_bars = Bars(np.zeros(0, dtype="datetime64[D]"), *(np.zeros(0),) * 4)
+        for delta_period, delta_tickers in stale.items():
+            try:
+                fetched = provider.fetch(delta_tickers, delta_period)
+            except Exception as error:
+                # The stored bars are still served, only without the latest days
+                print(f"Error updating stored data for tickers {delta_tickers}: {error}")
+                continue
+            for ticker in delta_tickers:
+                self.write(ticker, fetched.get(ticker, no_bars))
+
+        bars = {}
+        for ticker in tickers:
+            stored = self.read(ticker, start)
+            if stored is not None and len(stored.close) > 0:
+                bars[ticker] = stored
+        return bars
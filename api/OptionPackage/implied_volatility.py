@@ -0,0 +1,79 @@
+import numpy as np
+
+from .black_scholes import black_scholes
+
+
+# Implied volatilities of whole option chains. Every quote is solved at once: a rational
+# first guess, then safeguarded Newton steps with the vega of the vectorised kernel,
+# falling back to bisection inside a bracket that tightens every iteration. Each
+# iteration only reprices the quotes that have not converged yet.
+
+MIN_VOLATILITY = 1e-6
+MAX_VOLATILITY = 10.0
+
+
+def _initial_guess(S, discounted_strike, T, call_price):
+    # Corrado-Miller (1996) rational approximation, which is close near the money
+    half_moneyness = 0.5 * (S - discounted_strike)
+    excess = call_price - half_moneyness
+    root = np.sqrt(np.maximum(excess ** 2 - (S - discounted_strike) ** 2 / np.pi, 0))
+    guess = np.sqrt(2 * np.pi / T) / (S + discounted_strike) * (excess + root)
+    return np.clip(np.nan_to_num(guess, nan=0.3), 0.01, 3.0)
+
+
+def implied_volatility(price, S, K, T, r, is_call=True, tolerance=1e-10, max_iterations=100):
+    """
+    Solve for the Black-Scholes volatilities that reproduce quoted prices.
+
+    :param price: Quoted option price(s)
+    :param S: Spot price(s) of the underlying
+    :param K: Strike price(s)
+    :param T: Time(s) to maturity in years
+    :param r: Risk-free rate(s)
+    :param is_call: Boolean flag(s), True for calls and False for puts
+    :param tolerance: Accepted absolute price error
+    :param max_iterations: Cap on the number of Newton or bisection steps
+    :return: The implied volatility(ies), NaN where the price violates the no-arbitrage bounds
+    """
+    price, S, K, T, r, is_call = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (price, S, K, T, r)), np.asarray(is_call, dtype=bool))
+    shape = price.shape
+    price, S, K, T, r, is_call = (x.ravel() for x in (price, S, K, T, r, is_call))
+
+    # Solve on the out-of-the-money side, converting with put-call parity, where the
+    # price is all time value and most sensitive to the volatility
+    discounted_strike = K * np.exp(-r * T)
+    call_price = np.where(is_call, price, price + S - discounted_strike)
+    otm_call = S <= discounted_strike
+    target = np.where(otm_call, call_price, call_price - S + discounted_strike)
+    valid = (target > 0) & (call_price < S) & (T > 0)
+
+    sigma = np.full(price.shape, np.nan)
+    low = np.full(price.shape, MIN_VOLATILITY)
+    high = np.full(price.shape, MAX_VOLATILITY)
+    sigma[valid] = _initial_guess(S, discounted_strike, T, call_price)[valid]
+
+    active = np.flatnonzero(valid)
+    for _ in range(max_iterations):
+        if active.size == 0:
+            break
+        result = black_scholes(S[active], K[active], T[active], r[active], sigma[active], otm_call[active])
+        error = result["price"] - target[active]
+        converged = np.abs(error) <= tolerance
+
+        # The price increases with the volatility, so the error tightens the bracket
+        low[active] = np.where(error < 0, sigma[active], low[active])
+        high[active] = np.where(error > 0, sigma[active], high[active])
+
+        # Newton steps that leave the bracket, or have no vega to work with, bisect instead
+        vega = result["vega"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            newton = sigma[active] - error / vega
+        in_bracket = (newton > low[active]) & (newton < high[active]) & (vega > 1e-12 * S[active])
+        step = np.where(in_bracket, newton, 0.5 * (low[active] + high[active]))
+
+        sigma[active] = np.where(converged, sigma[active], step)
+        active = active[~converged]
+
+    sigma = sigma.reshape(shape)
+    return sigma[()] if sigma.ndim == 0 else sigma
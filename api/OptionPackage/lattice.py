@@ -0,0 +1,103 @@
+import numpy as np
+
+
+# Binomial lattices. The tree is rolled back one time step at a time on a single vector
+# of node values, so memory is O(steps) per contract, and every input may be an array:
+# a batch of contracts (legs, spot-grid points, bumped parameters) is rolled back
+# together, one vectorised operation per time step.
+#
+# Two parametrisations are available: Cox-Ross-Rubinstein, and Leisen-Reimer (1996),
+# which centres the tree on the strike with the Peizer-Pratt inversion. It converges
+# quadratically for European contracts; with early exercise the error falls roughly as
+# 1/n, but smoothly, without the CRR oscillation, so Richardson extrapolation works on it
+# and far fewer steps reach the same accuracy.
+
+def _peizer_pratt(z, n):
+    # Peizer-Pratt method 2 inversion of the normal cdf onto a binomial probability
+    return 0.5 + np.sign(z) * np.sqrt(0.25 - 0.25 * np.exp(-(z / (n + 1/3 + 0.1 / (n + 1))) ** 2 * (n + 1/6)))
+
+
+def binomial_tree(S, K, T, r, sigma, is_call=True, steps=300, american=True, greeks=False, method="crr"):
+    """
+    Price options on a CRR binomial tree.
+
+    :param S: Spot price(s) of the underlying
+    :param K: Strike price(s)
+    :param T: Time(s) to maturity in years
+    :param r: Risk-free rate(s)
+    :param sigma: Volatility(ies)
+    :param is_call: Boolean flag(s), True for calls and False for puts
+    :param steps: Number of time steps in the tree
+    :param american: Allow early exercise at every node
+    :param greeks: Also return delta, gamma and theta (per year) read off the first tree nodes
+    :param method: "crr" for Cox-Ross-Rubinstein or "leisen-reimer" (rounded up to an odd step count)
+    :return: The option price(s), broadcast to the shape of the inputs, or a dict of arrays if greeks is set
+    """
+    if method == "leisen-reimer":
+        steps += 1 - steps % 2
+    elif method != "crr":
+        raise ValueError("Invalid lattice method")
+    if greeks and steps < 2:
+        raise ValueError("Lattice greeks need a tree of at least two steps")
+
+    S, K, T, r, sigma, is_call = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (S, K, T, r, sigma)), np.asarray(is_call, dtype=bool))
+    shape = S.shape
+
+    # Work on a flat batch, with the tree nodes along the last axis
+    S, K, T, r, sigma, is_call = (x.reshape(-1, 1) for x in (S, K, T, r, sigma, is_call))
+    sign = np.where(is_call, 1.0, -1.0)
+
+    dt = T / steps  # Length of one time step
+    growth = np.exp(r * dt)
+    if method == "crr":
+        u = np.exp(sigma * np.sqrt(dt))  # Up factor
+        d = 1 / u  # Down factor
+        p = (growth - d) / (u - d)  # Risk-neutral probability
+    else:
+        d1 = (np.log(S / K) + (r + 0.5 * sigma ** 2) * T) / (sigma * np.sqrt(T))
+        p = _peizer_pratt(d1 - sigma * np.sqrt(T), steps)
+        u = growth * _peizer_pratt(d1, steps) / p
+        d = (growth - p * u) / (1 - p)
+    discount = 1 / growth
+
+    # Stock prices at maturity, node j has had j down moves
+    j = np.arange(steps + 1)
+    stock = S * u ** (steps - j) * d ** j
+    values = np.maximum(sign * (stock - K), 0)
+
+    # Roll back, the level-i nodes are the level-(i+1) nodes with one up move fewer.
+    # The first three levels are kept for the greeks.
+    levels = {steps: (stock, values)}
+    for i in range(steps - 1, -1, -1):
+        values = discount * (p * values[:, :i + 1] + (1 - p) * values[:, 1:i + 2])
+        stock = stock[:, :i + 1] / u
+        if american:
+            values = np.maximum(values, sign * (stock - K))
+        if i <= 2:
+            levels[i] = (stock, values)
+
+    def unflatten(x):
+        x = x.reshape(shape)
+        return x[()] if x.ndim == 0 else x
+
+    price = values[:, 0]
+    if not greeks:
+        return unflatten(price)
+
+    # Central differences on the nodes one and two steps in, which need no extra trees
+    (S1, V1), (S2, V2) = levels[1], levels[2]
+    delta = (V1[:, 0] - V1[:, 1]) / (S1[:, 0] - S1[:, 1])
+    delta_up = (V2[:, 0] - V2[:, 1]) / (S2[:, 0] - S2[:, 1])
+    delta_down = (V2[:, 1] - V2[:, 2]) / (S2[:, 1] - S2[:, 2])
+    gamma = (delta_up - delta_down) / (0.5 * (S2[:, 0] - S2[:, 2]))
+    # The middle node two steps in sits at the initial spot for CRR, Leisen-Reimer
+    # trees drift slightly off it so the difference is corrected with delta
+    theta = (V2[:, 1] - price - delta * (S2[:, 1] - S[:, 0])) / (2 * dt[:, 0])
+
+    return {
+        "price": unflatten(price),
+        "delta": unflatten(delta),
+        "gamma": unflatten(gamma),
+        "theta": unflatten(theta),
+    }
@@ -0,0 +1,321 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+from .history_store import HistoryStore
+from .market_data_providers import ReplayProvider, YFinanceProvider
+
+
+# Price histories shared by every contract on the same underlying. Each ticker is
+# fetched once per cache lifetime and kept as one read-only array of closes, which all
+# options on it point to, instead of every option holding its own copy of a year of prices.
+
+class PriceHistory:
+    __slots__ = ("ticker", "closes", "bars")
+
+    def __init__(self, ticker, closes, bars=None):
+        closes = np.asarray(closes, dtype=float).ravel()
+        if closes.flags.writeable:
+            # Shared between options, so a private read-only copy
+            closes = closes.copy()
+            closes.flags.writeable = False
+        self.ticker = ticker
+        self.closes = closes
+        self.bars = bars  # The OHLC Bars the closes come from, when the provider had them
+
+    @classmethod
+    def from_bars(cls, ticker, bars):
+        for column in bars:
+            column.flags.writeable = False
+        return cls(ticker, bars.close, bars)
+
+    @property
+    def last_close(self):
+        return float(self.closes[-1])
+
+    @property
+    def nbytes(self):
+        if self.bars is not None:
+            return sum(column.nbytes for column in self.bars)
+        return self.closes.nbytes
+
+
+# Downloaded histories are kept per (ticker, period) for a limited time, the least
+# recently used ones dropped past a size limit. Concurrent requests for a ticker that is
+# being downloaded wait for that download instead of starting their own.
+
+DEFAULT_TTL = float(os.environ.get("MARKET_DATA_TTL", 15 * 60))  # Seconds
+DEFAULT_MAX_ENTRIES = int(os.environ.get("MARKET_DATA_MAX_ENTRIES", 512))
+
+# Downloads from async code run on a small pool of threads, at most a few of them talking
+# to the upstream at once, and each with a time limit
+FETCH_WORKERS = int(os.environ.get("MARKET_DATA_WORKERS", 8))
+MAX_CONCURRENT_FETCHES = int(os.environ.get("MARKET_DATA_CONCURRENCY", 4))
+FETCH_TIMEOUT = float(os.environ.get("MARKET_DATA_TIMEOUT", 10))  # Seconds
+
+
+class MarketDataCache:
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0  # Misses served by another caller's download
+        self._entries = OrderedDict()  # (ticker, period) -> (history, expiry time)
+        self._in_flight = {}  # (ticker, period) -> Future of the running download
+        self._lock = threading.Lock()
+
+    def _lookup(self, key):
+        # The cached history if it has not expired, to be called holding the lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        history, expiry = entry
+        if self.clock() >= expiry:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return history
+
+    def _store(self, key, history, ttl):
+        # To be called holding the lock
+        self._entries[key] = (history, self.clock() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, ticker, period="1y", fetch=None):
+        """
+        The history of a ticker, from the cache or fetched once for all concurrent callers.
+
+        :param ticker: The ticker symbol
+        :param period: The period of daily closes, as in yfinance
+        :param fetch: Function (ticker, period) -> Bars, the market data provider by default
+        :return: The shared PriceHistory
+        """
+        fetch_many = None if fetch is None else (lambda tickers, period: {ticker: fetch(ticker, period)})
+        histories, errors = self.get_many([ticker], period, fetch_many)
+        if ticker in errors:
+            raise errors[ticker]
+        return histories[ticker]
+
+    def get_many(self, tickers, period="1y", fetch_many=None):
+        """
+        The histories of several tickers, the ones not cached fetched in a single batch.
+
+        Tickers another caller is already downloading are waited for, not fetched again.
+
+        :param tickers: The ticker symbols
+        :param period: The period of daily closes, as in yfinance
+        :param fetch_many: Function (tickers, period) -> dict of Bars per ticker, the
+                           market data provider by default
+        :return: A dict of PriceHistory per ticker, and a dict of the error per ticker that
+                 could not be fetched
+        """
+        histories, errors, waiting, leading = {}, {}, {}, {}
+        with self._lock:
+            for ticker in dict.fromkeys(tickers):
+                key = (ticker, period)
+                history = self._lookup(key)
+                if history is not None:
+                    self.hits += 1
+                    histories[ticker] = history
+                    continue
+                self.misses += 1
+                if key in self._in_flight:
+                    self.coalesced += 1
+                    waiting[ticker] = self._in_flight[key]
+                else:
+                    leading[ticker] = self._in_flight[key] = Future()
+
+        if leading:
+            try:
+                bars = (fetch_many or _fetch_bars)(list(leading), period)
+            except Exception as error:
+                bars = {}
+                errors.update((ticker, error) for ticker in leading)
+            for ticker, future in leading.items():
+                if ticker not in errors and (ticker not in bars or len(bars[ticker].close) == 0):
+                    errors[ticker] = ValueError(f"No price data for ticker {ticker}")
+                with self._lock:
+                    del self._in_flight[(ticker, period)]
+                    if ticker not in errors:
+                        histories[ticker] = PriceHistory.from_bars(ticker, bars[ticker])
+                        self._store((ticker, period), histories[ticker], self.ttl)
+                if ticker in errors:
+                    future.set_exception(errors[ticker])
+                else:
+                    future.set_result(histories[ticker])
+
+        for ticker, future in waiting.items():
+            try:
+                histories[ticker] = future.result()
+            except Exception as error:
+                errors[ticker] = error
+        return histories, errors
+
+    def put(self, ticker, history, period="1y", ttl=None):
+        # Store a history directly, for ttl seconds (the cache TTL by default)
+        with self._lock:
+            self._store((ticker, period), history, self.ttl if ttl is None else ttl)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "in_flight": len(self._in_flight),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.coalesced = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# The cache shared by the whole process
+market_data_cache = MarketDataCache()
+
+
+_executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="market-data")
+_fetch_slots = threading.BoundedSemaphore(MAX_CONCURRENT_FETCHES)
+
+
+def _default_provider():
+    # Recorded bars when MARKET_DATA_REPLAY_DIR is set, for offline and load test runs
+    directory = os.environ.get("MARKET_DATA_REPLAY_DIR")
+    if directory:
+        return ReplayProvider(directory, latency=float(os.environ.get("MARKET_DATA_REPLAY_LATENCY", 0)))
+    return YFinanceProvider(timeout=FETCH_TIMEOUT)
+
+
+_provider = _default_provider()
+
+
+def get_provider():
+    return _provider
+
+
+def set_provider(provider):
+    # Fetch through another MarketDataProvider from now on, dropping the cached data
+    global _provider
+    _provider = provider
+    market_data_cache.clear()
+
+
+# Bars are kept on disk across restarts when MARKET_DATA_STORE_DIR is set, so the
+# provider is only asked for the days that are not stored yet
+_history_store = None
+if os.environ.get("MARKET_DATA_STORE_DIR"):
+    _history_store = HistoryStore(os.environ["MARKET_DATA_STORE_DIR"], refresh=DEFAULT_TTL)
+
+
+def set_history_store(store):
+    # Read and complete bars through another HistoryStore, or None to always download
+    global _history_store
+    _history_store = store
+    market_data_cache.clear()
+
+
+# Optional tier shared with the other worker processes of the host: bars another worker
+# fetched recently are taken from it, and fetched bars are published to it
+_shared_tier = None
+
+
+def set_shared_tier(tier):
+    # An object with get_bars(tickers, period) and put_bars(bars, period), or None
+    global _shared_tier
+    _shared_tier = tier
+
+
+def _fetch_bars(tickers, period="1y"):
+    bars = {} if _shared_tier is None else _shared_tier.get_bars(tickers, period)
+    missing = [ticker for ticker in tickers if ticker not in bars]
+    if missing:
+        with _fetch_slots:
+            if _history_store is not None:
+                fetched = _history_store.fetch(_provider, missing, period)
+            else:
+                fetched = _provider.fetch(missing, period)
+        if _shared_tier is not None and fetched:
+            _shared_tier.put_bars(fetched, period)
+        bars.update(fetched)
+    return bars
+
+
+def register_history(ticker, closes, period="1y"):
+    """
+    Store a price history for a ticker, replacing any earlier one. It does not expire.
+
+    :param ticker: The ticker symbol
+    :param closes: Daily closing prices, oldest first
+    :param period: The period the closes cover
+    :return: The shared PriceHistory
+    """
+    history = PriceHistory(ticker, closes)
+    market_data_cache.put(ticker, history, period, ttl=math.inf)
+    return history
+
+
+def get_history(ticker, period="1y"):
+    """
+    The shared price history of a ticker, downloaded on first use and cached.
+
+    :param ticker: The ticker symbol
+    :param period: The period of daily closes
+    :return: The PriceHistory every option on this ticker shares
+    """
+    return market_data_cache.get(ticker, period)
+
+
+def get_histories(tickers, period="1y"):
+    """
+    The shared price histories of several tickers, the missing ones in one batched download.
+
+    :param tickers: The ticker symbols
+    :param period: The period of daily closes
+    :return: A dict of PriceHistory per ticker, and a dict of the error per failed ticker
+    """
+    return market_data_cache.get_many(tickers, period)
+
+
+async def fetch_histories(tickers, period="1y", timeout=FETCH_TIMEOUT):
+    """
+    Get the histories of several tickers without blocking the event loop.
+
+    The batched download runs on the market data thread pool. A download that outlives
+    the timeout keeps running there and fills the cache when it completes.
+
+    :param tickers: The ticker symbols, None entries are skipped
+    :param period: The period of daily closes
+    :param timeout: Seconds to wait for the download
+    :return: A dict of PriceHistory per ticker, and a dict of the error per failed ticker
+    """
+    tickers = list(dict.fromkeys(ticker for ticker in tickers if ticker))
+    if not tickers:
+        return {}, {}
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(loop.run_in_executor(_executor, get_histories, tickers, period), timeout)
+    except asyncio.TimeoutError as error:
+        return {}, {ticker: error for ticker in tickers}
+
+
+def clear_histories():
+    market_data_cache.clear()
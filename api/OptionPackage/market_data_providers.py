@@ -0,0 +1,141 @@
+import csv
+import os
+import re
+import time
+from collections import namedtuple
+
+import numpy as np
+import yfinance as yf
+
+
+# Sources of daily OHLC bars. The market data cache fetches through one provider: yfinance
+# in production, or a replay of recorded bars from disk, which answers the same requests
+# without network (with an optional artificial delay) for offline, repeatable runs.
+
+# Daily bars of one ticker, oldest first: datetime64[D] dates and float arrays of prices
+Bars = namedtuple("Bars", ("dates", "open", "high", "low", "close"))
+
+FIELDS = ("Open", "High", "Low", "Close")
+
+# Ticker symbols as yfinance writes them (BRK-B, ^GSPC, EURUSD=X, ...). Tickers come from
+# clients and the model, so only these may become part of a file name
+TICKER_PATTERN = re.compile(r"^[A-Za-z0-9.^=-]+$")
+
+
+def is_valid_ticker(ticker):
+    return isinstance(ticker, str) and TICKER_PATTERN.match(ticker) is not None
+
+
+# Length of the yfinance periods, in calendar days
+PERIOD_DAYS = {"1d": 1, "5d": 5, "1mo": 31, "3mo": 92, "6mo": 183, "1y": 366, "2y": 731, "5y": 1827, "10y": 3653}
+
+
+def make_bars(dates, opens, highs, lows, closes):
+    # Bars from columns of any sequence type, with the rows that miss a close dropped
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    columns = [np.asarray(column, dtype=float) for column in (opens, highs, lows, closes)]
+    keep = ~np.isnan(columns[3])
+    return Bars(dates[keep], *(column[keep] for column in columns))
+
+
+class MarketDataProvider:
+    def fetch(self, tickers, period="1y"):
+        """
+        Daily bars of several tickers in one request.
+
+        :param tickers: The ticker symbols
+        :param period: How far back to go, as in yfinance ("1mo", "1y", "max", ...)
+        :return: A dict of Bars per ticker, tickers without data are left out
+        """
+        raise NotImplementedError("Subclasses should implement this method")
+
+
+class YFinanceProvider(MarketDataProvider):
+    def __init__(self, timeout=10):
+        self.timeout = timeout  # Seconds per HTTP request
+
+    def fetch(self, tickers, period="1y"):
+        tickers = list(tickers)
+        data = yf.download(tickers, period=period, progress=False, group_by="column", timeout=self.timeout)
+        bars = {}
+        for ticker in tickers:
+            columns = []
+            for field in FIELDS:
+                column = data[field]
+                if column.ndim == 2:
+                    # One column per ticker in the multi-ticker frame
+                    if ticker not in column.columns:
+                        break
+                    column = column[ticker]
+                columns.append(column.to_numpy())
+            else:
+                bars[ticker] = make_bars(data.index.values.astype("datetime64[D]"), *columns)
+        return bars
+
+
+class ReplayProvider(MarketDataProvider):
+    def __init__(self, directory, latency=0.0, jitter=0.0, seed=None):
+        """
+        Serve bars recorded as <directory>/<TICKER>.csv with Date,Open,High,Low,Close columns.
+
+        :param directory: Folder of the recorded files
+        :param latency: Seconds every fetch waits, like one round trip upstream
+        :param jitter: Extra random wait, uniform up to this many seconds
+        :param seed: Seed of the jitter, for repeatable timings
+        """
+        self.directory = directory
+        self.latency = latency
+        self.jitter = jitter
+        self._rng = np.random.default_rng(seed)
+        self._bars = {}  # Files already read, by ticker
+
+    def path(self, ticker):
+        return os.path.join(self.directory, f"{ticker}.csv")
+
+    def _load(self, ticker):
+        if ticker not in self._bars:
+            if not is_valid_ticker(ticker) or not os.path.exists(self.path(ticker)):
+                return None
+            with open(self.path(ticker), newline="") as file:
+                rows = list(csv.DictReader(file))
+            self._bars[ticker] = make_bars([row["Date"][:10] for row in rows],
+                                           *([row[field] or np.nan for row in rows] for field in FIELDS))
+        return self._bars[ticker]
+
+    def fetch(self, tickers, period="1y"):
+        delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+        bars = {}
+        for ticker in tickers:
+            recorded = self._load(ticker)
+            if recorded is None or len(recorded.close) == 0:
+                continue
+            if period in PERIOD_DAYS:
+                # The same window a download on the last recorded day would return
+                start = recorded.dates[-1] - np.timedelta64(PERIOD_DAYS[period], "D")
+                recorded = Bars(*(column[recorded.dates > start] for column in recorded))
+            bars[ticker] = recorded
+        return bars
+
+    @staticmethod
+    def record(provider, tickers, directory, period="1y"):
+        """
+        Write the bars of another provider to disk, for a ReplayProvider to serve later.
+
+        :param provider: The provider to record from, e.g. a YFinanceProvider
+        :param tickers: The ticker symbols
+        :param directory: Folder to write the files to
+        :param period: The period to record
+        :return: The tickers that were written
+        """
+        os.makedirs(directory, exist_ok=True)
+        bars = provider.fetch(tickers, period)
+        for ticker, recorded in bars.items():
+            with open(os.path.join(directory, f"{ticker}.csv"), "w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(("Date",) + FIELDS)
+                for row in zip(recorded.dates.astype(str), *(column.tolist() for column in recorded[1:])):
+                    writer.writerow(row)
+        return list(bars)
@@ -0,0 +1,198 @@
+from collections import namedtuple
+
+import numpy as np
+from scipy.special import ndtri
+from scipy.stats import qmc
+
+from .black_scholes import black_scholes
+
+
+# Monte Carlo engine for path-dependent options under geometric Brownian motion.
+# Paths are simulated in chunks of bounded size, so memory does not grow with the number
+# of paths, and the simulation stops as soon as the standard error reaches the target.
+
+MonteCarloResult = namedtuple("MonteCarloResult", ["price", "std_error", "n_paths"])
+
+
+def normal_chunks(n_steps, chunk_size, seed=None, antithetic=True, sobol=False):
+    """
+    Generate chunks of standard normal increments, each of shape (chunk_size, n_steps).
+
+    With antithetic variates the second half of each chunk mirrors the first half, row for
+    row. With Sobol sequences every chunk is an independently scrambled point set, so the
+    chunks are independent replicates (use a power of two as chunk size).
+    """
+    seeds = np.random.SeedSequence(seed)
+    rng = np.random.default_rng(seeds.spawn(1)[0])
+    draws = chunk_size // 2 if antithetic else chunk_size
+
+    while True:
+        if sobol:
+            sampler = qmc.Sobol(d=n_steps, scramble=True, seed=np.random.default_rng(seeds.spawn(1)[0]))
+            uniforms = sampler.random(draws)
+            normals = ndtri(np.clip(uniforms, 1e-12, 1 - 1e-12))
+        else:
+            normals = rng.standard_normal((draws, n_steps))
+        yield np.concatenate([normals, -normals]) if antithetic else normals
+
+
+def gbm_paths(S0, T, r, sigma, normals):
+    # Prices at the n_steps monitoring dates after S0 for each row of normal increments
+    n_steps = normals.shape[-1]
+    dt = T / n_steps
+    log_increments = (r - 0.5 * sigma ** 2) * dt + sigma * np.sqrt(dt) * normals
+    return S0 * np.exp(np.cumsum(log_increments, axis=-1))
+
+
+class _RunningEstimate:
+    # Sufficient statistics for the (control-variate adjusted) sample mean. The samples
+    # may have several columns, e.g. one per bumped spot on the same paths; then the
+    # control coefficient of the first column is used for all of them, so the noise they
+    # share cancels in their differences.
+
+    def __init__(self):
+        self.n = 0
+        self.sums = 0.0  # Y, X, Y^2, X^2, XY
+
+    def add(self, Y, X):
+        self.n += len(Y)
+        self.sums = self.sums + np.array([Y.sum(axis=0), X.sum(axis=0), (Y * Y).sum(axis=0), (X * X).sum(axis=0),
+                                          (X * Y).sum(axis=0)])
+
+    def result(self, control_mean=None):
+        n = self.n
+        mean_Y, mean_X, mean_YY, mean_XX, mean_XY = self.sums / n
+        var_Y = (mean_YY - mean_Y ** 2) * n / max(n - 1, 1)
+        if control_mean is None:
+            return mean_Y, np.sqrt(np.maximum(var_Y, 0) / n)
+
+        var_X = (mean_XX - mean_X ** 2) * n / max(n - 1, 1)
+        cov_XY = (mean_XY - mean_X * mean_Y) * n / max(n - 1, 1)
+        first = (0,) * np.ndim(var_X)
+        b = cov_XY[first] / var_X[first] if var_X[first] > 0 else 0.0
+        price = mean_Y - b * (mean_X - control_mean)
+        variance = var_Y - 2 * b * cov_XY + b * b * var_X
+        return price, np.sqrt(np.maximum(variance, 0) / n)
+
+
+def run_monte_carlo(sample, n_steps, target_error=1e-2, max_paths=1_000_000, chunk_size=8192,
+                    control_mean=None, antithetic=True, sobol=False, seed=None):
+    """
+    Drive a chunked Monte Carlo simulation until the standard error reaches the target.
+
+    :param sample: Maps a chunk of normals to discounted payoffs Y and control payoffs X,
+                   with one row per path and optionally a column per contract
+    :param n_steps: Number of monitoring dates per path
+    :param target_error: Standard error at which to stop early
+    :param max_paths: Upper bound on the number of simulated paths
+    :param chunk_size: Number of paths per chunk, which bounds the memory use
+    :param control_mean: Known expectation of X, or None to use no control variate
+    :param antithetic: Use antithetic variates
+    :param sobol: Use scrambled Sobol sequences instead of pseudo-random numbers
+    :param seed: Seed of the random generators, fix it for common random numbers across bumps
+    :return: A MonteCarloResult with the price, its standard error and the number of paths
+    """
+    chunks = normal_chunks(n_steps, chunk_size, seed, antithetic, sobol)
+    pooled = _RunningEstimate()
+    replicates = []
+    n_paths = 0
+    price, std_error = np.nan, np.inf
+
+    while n_paths < max_paths:
+        normals = next(chunks)
+        Y, X = sample(normals)
+        n_paths += len(Y)
+
+        if antithetic:
+            # Antithetic pairs are averaged into one independent sample
+            half = len(Y) // 2
+            Y, X = (Y[:half] + Y[half:]) / 2, (X[:half] + X[half:]) / 2
+
+        if sobol:
+            # Each scrambled chunk is one replicate, the error comes from their spread
+            chunk = _RunningEstimate()
+            chunk.add(Y, X)
+            replicates.append(chunk.result(control_mean)[0])
+            price = np.mean(replicates, axis=0)
+            if len(replicates) < 2:
+                continue
+            std_error = np.std(replicates, axis=0, ddof=1) / np.sqrt(len(replicates))
+        else:
+            pooled.add(Y, X)
+            price, std_error = pooled.result(control_mean)
+
+        if np.all(std_error <= target_error):
+            break
+
+    return MonteCarloResult(price, std_error, n_paths)
+
+
+def asian_monte_carlo(S0, K, T, r, sigma, option_type="call", n_steps=252, control_price=None, spot_scales=None,
+                      **kwargs):
+    """
+    Price an arithmetic-average Asian option by Monte Carlo.
+
+    The average runs over S0 and the n_steps equally spaced dates up to T, the same
+    fixings as the closed-form geometric Asian price, which is used as control variate
+    when given as control_price. Remaining keyword arguments go to run_monte_carlo.
+
+    With spot_scales the option is priced at each spot S0 * scale on the same paths, as
+    GBM paths scale with their spot, and control_price holds one price per scale. The
+    control coefficient of the first scale is used for all, so finite differences of the
+    prices keep little of the simulation noise.
+
+    :return: A MonteCarloResult, with arrays of one price per scale if spot_scales is given
+    """
+    sign = 1 if option_type == "call" else -1
+    discount = np.exp(-r * T)
+    scales = None if spot_scales is None else np.asarray(spot_scales, dtype=float)
+
+    def sample(normals):
+        paths = gbm_paths(S0, T, r, sigma, normals)
+        arithmetic = (S0 + paths.sum(axis=1)) / (n_steps + 1)
+        geometric = np.exp((np.log(S0) + np.log(paths).sum(axis=1)) / (n_steps + 1))
+        if scales is not None:
+            arithmetic, geometric = arithmetic[:, np.newaxis] * scales, geometric[:, np.newaxis] * scales
+        return (discount * np.maximum(sign * (arithmetic - K), 0),
+                discount * np.maximum(sign * (geometric - K), 0))
+
+    return run_monte_carlo(sample, n_steps, control_mean=control_price, **kwargs)
+
+
+def barrier_monte_carlo(S0, K, H, T, r, sigma, option_type="call", barrier_type="down-and-out",
+                        n_steps=252, bridge=True, **kwargs):
+    """
+    Price a single barrier option without rebate by Monte Carlo.
+
+    The barrier is checked at S0 and the n_steps equally spaced dates up to T. With bridge
+    set, a path that stays on one side at two consecutive dates still crosses in between
+    with the Brownian-bridge probability exp(-2 ln(S_i/H) ln(S_i+1/H) / (sigma^2 dt)), and
+    the payoff is weighted with the probability of survival instead of checking for hits,
+    which prices the continuously monitored barrier without bias and with less variance.
+    The vanilla payoff, whose Black-Scholes price is known, is used as control variate.
+    Remaining keyword arguments go to run_monte_carlo.
+
+    :return: A MonteCarloResult
+    """
+    if not barrier_type.startswith(("down-and-in", "down-and-out", "up-and-in", "up-and-out")):
+        raise ValueError("Invalid barrier type")
+    sign = 1 if option_type == "call" else -1
+    side = 1 if barrier_type.startswith("up") else -1  # Crossing direction of the barrier
+    knock_in = "-in" in barrier_type
+    discount = np.exp(-r * T)
+    variance_dt = sigma ** 2 * T / n_steps
+
+    def sample(normals):
+        paths = gbm_paths(S0, T, r, sigma, normals)
+        log_distance = np.log(np.concatenate([np.full((len(paths), 1), S0), paths], axis=1) / H)
+        alive = np.all(side * log_distance < 0, axis=1)
+        survival = alive.astype(float)
+        if bridge:
+            crossing = np.exp(-2 * log_distance[:, :-1] * log_distance[:, 1:] / variance_dt)
+            survival *= np.prod(1 - crossing, axis=1)
+
+        vanilla = discount * np.maximum(sign * (paths[:, -1] - K), 0)
+        return vanilla * (1 - survival if knock_in else survival), vanilla
+
+    control_price = black_scholes(S0, K, T, r, sigma, sign == 1)["price"]
+    return run_monte_carlo(sample, n_steps, control_mean=control_price, **kwargs)
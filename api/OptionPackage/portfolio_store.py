@@ -0,0 +1,176 @@
+import numpy as np
+
+from .black_scholes import black_scholes
+
+
+# Columnar record of a portfolio: one contiguous NumPy column per contract field and one
+# row per leg, a compact copy of the book that is cheap to measure and to serialise.
+# Strings (flavour, barrier type, ticker) are stored as small integer codes; the rows
+# round-trip to the position dicts the front end exchanges. The vanilla legs are priced
+# straight from the columns, and the per-ticker sums group on the ticker column; the
+# other flavours are priced on the netted contracts of OptionPortfolio.
+
+FLAVOURS = ("vanilla", "barrier", "asian", "american")
+BARRIER_TYPES = ("down-and-in", "down-and-out", "up-and-in", "up-and-out")
+
+COLUMNS = {
+    "flavour": np.int8,
+    "is_call": np.bool_,
+    "K": np.float64,
+    "T": np.float64,
+    "r": np.float64,
+    "sigma": np.float64,
+    "S0": np.float64,
+    "quantity": np.float64,  # Signed, negative for short legs
+    "H": np.float64,  # NaN without a barrier
+    "barrier_type": np.int8,  # -1 without a barrier
+    "ticker_id": np.int32,  # -1 without a ticker
+}
+
+
+def _float(x):
+    return np.nan if x is None else float(x)
+
+
+class PortfolioStore:
+    def __init__(self, capacity=16):
+        self._columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self._size = 0
+        self.tickers = []  # Ticker of each ticker id
+        self._ticker_ids = {}
+
+    def __len__(self):
+        return self._size
+
+    def __getattr__(self, name):
+        # Columns read as attributes, e.g. store.K, trimmed to the filled rows
+        columns = self.__dict__.get("_columns")
+        if columns is None or name not in columns:
+            raise AttributeError(name)
+        return columns[name][:self._size]
+
+    @property
+    def nbytes(self):
+        return sum(column[:self._size].nbytes for column in self._columns.values())
+
+    def _ticker_code(self, ticker):
+        if ticker is None:
+            return -1
+        if ticker not in self._ticker_ids:
+            self._ticker_ids[ticker] = len(self.tickers)
+            self.tickers.append(ticker)
+        return self._ticker_ids[ticker]
+
+    def append(self, flavour, option_type, K, T, r, sigma, S0, quantity, H=None, barrier_type=None, ticker=None):
+        """
+        Add one leg and return its row.
+
+        :param flavour: "vanilla", "barrier", "asian" or "american"
+        :param option_type: "call" or "put"
+        :param quantity: Signed number of contracts, negative for short legs
+        :param H: Barrier level, or None
+        :param barrier_type: One of BARRIER_TYPES, or None
+        :param ticker: Ticker of the underlying, or None
+        :return: The row index of the leg
+        """
+        if flavour not in FLAVOURS:
+            raise ValueError("Invalid option flavour")
+        if option_type not in ("call", "put"):
+            raise ValueError("Invalid option type")
+        if barrier_type is not None and barrier_type not in BARRIER_TYPES:
+            raise ValueError("Invalid barrier type")
+
+        if self._size == len(self._columns["K"]):
+            # Double the capacity, so appends are amortised O(1)
+            for name, column in self._columns.items():
+                grown = np.empty(2 * len(column), dtype=column.dtype)
+                grown[:self._size] = column[:self._size]
+                self._columns[name] = grown
+
+        row = self._size
+        values = {
+            "flavour": FLAVOURS.index(flavour),
+            "is_call": option_type == "call",
+            "K": _float(K),
+            "T": _float(T),
+            "r": _float(r),
+            "sigma": _float(sigma),
+            "S0": _float(S0),
+            "quantity": float(quantity),
+            "H": _float(H),
+            "barrier_type": -1 if barrier_type is None else BARRIER_TYPES.index(barrier_type),
+            "ticker_id": self._ticker_code(ticker),
+        }
+        for name, value in values.items():
+            self._columns[name][row] = value
+        self._size += 1
+        return row
+
+    def remove(self, row):
+        # Shift the rows after it up by one
+        for column in self._columns.values():
+            column[row:self._size - 1] = column[row + 1:self._size]
+        self._size -= 1
+
+    def clear(self):
+        self._size = 0
+        self.tickers = []
+        self._ticker_ids = {}
+
+    def rows_of(self, flavour):
+        # Row indices of the legs of one flavour
+        return np.flatnonzero(self.flavour == FLAVOURS.index(flavour))
+
+    def net(self, rows, fields=("is_call", "K", "T", "r", "sigma")):
+        """
+        Merge the rows that agree on the given columns.
+
+        :param rows: Row indices
+        :param fields: The columns that identify a contract
+        :return: One row standing for each group and the net signed quantity of the group,
+                 groups that offset to zero left out
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        table = np.column_stack([self._columns[name][rows].astype(float) for name in fields])
+        _, first, inverse = np.unique(table, axis=0, return_index=True, return_inverse=True)
+        quantity = np.bincount(inverse.ravel(), weights=self.quantity[rows], minlength=len(first))
+        kept = quantity != 0
+        return rows[first[kept]], quantity[kept]
+
+    def vanilla_greeks(self, rows, S=None):
+        # Black-Scholes price and greeks of vanilla rows in one kernel call, each at its own
+        # spot or crossed with the spot grid S on a trailing axis
+        rows = np.asarray(rows, dtype=np.intp)
+        S = self.S0[rows] if S is None else np.asarray(S, dtype=float)[..., np.newaxis]
+        greeks = black_scholes(S, self.K[rows], self.T[rows], self.r[rows], self.sigma[rows], self.is_call[rows])
+        return {("value" if name == "price" else name): greek for name, greek in greeks.items()}
+
+    def sum_by_ticker(self, values):
+        # Per-row values (rows on the leading axis) summed for each ticker
+        values = np.asarray(values, dtype=float)
+        codes, inverse = np.unique(self.ticker_id, return_inverse=True)
+        sums = np.zeros((len(codes),) + values.shape[1:])
+        np.add.at(sums, inverse.ravel(), values)
+        tickers = [None] + self.tickers
+        return {tickers[code + 1]: total for code, total in zip(codes.tolist(), sums)}
+
+    def to_dicts(self):
+        # The legs in the position dict format of the front end and the GPT tools,
+        # built from whole columns converted to Python lists at once
+        tickers = [None] + self.tickers
+        barrier_types = [None] + list(BARRIER_TYPES)
+        quantity = np.abs(self.quantity)
+        columns = zip(self.flavour.tolist(), self.is_call.tolist(), self.K.tolist(), quantity.tolist(),
+                      (quantity == np.round(quantity)).tolist(), (self.quantity >= 0).tolist(),
+                      (self.ticker_id + 1).tolist(), np.where(np.isnan(self.H), None, self.H).tolist(),
+                      (self.barrier_type + 1).tolist())
+        return [{
+            "option_flavour": FLAVOURS[flavour],
+            "option_type": "call" if is_call else "put",
+            "strike_price": K,
+            "quantity": int(q) if whole else q,
+            "position": "long" if long else "short",
+            "underlying_ticker": tickers[ticker],
+            "barrier_level": H,
+            "barrier_type": barrier_types[barrier_type],
+        } for flavour, is_call, K, q, whole, long, ticker, H, barrier_type in columns]
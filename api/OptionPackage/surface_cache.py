@@ -0,0 +1,173 @@
+from collections import OrderedDict
+
+import numpy as np
+from numpy.polynomial import Chebyshev
+
+
+# Price surfaces in the spot for the flavours without a cheap closed form. A contract is
+# priced once on Chebyshev nodes over a spot range, the interpolant is refined until its
+# trailing coefficients fall under the tolerance, and values, deltas and gammas at any
+# spot in the range are then polynomial evaluations and their analytic derivatives. The
+# deltas and gammas are checked against the contract's own greeks, and where the fit cannot
+# match them (noisy tree or Monte Carlo prices) the spots are priced directly instead.
+# Barriers split the range so no piece straddles the jump at the barrier.
+
+# Contract parameters that identify a surface, besides the flavour; S0 is not one of them
+CONTRACT_FIELDS = ("K", "T", "r", "sigma", "option_type", "H", "barrier_type", "asian_type",
+                   "engine", "steps", "target_error", "max_paths", "antithetic", "sobol", "seed")
+
+
+def contract_key(option):
+    return (type(option).__name__,) + tuple(getattr(option, name, None) for name in CONTRACT_FIELDS)
+
+
+def _prices_at(option, S, method="price"):
+    # Price (or a greek of) the contract at every spot in S without touching the option itself
+    if option.supports_arrays:
+        return np.broadcast_to(getattr(option._bumped(S0=S), method)(), S.shape).astype(float)
+    return np.array([getattr(option._bumped(S0=s), method)() for s in S], dtype=float)
+
+
+class ChebyshevSurface:
+    def __init__(self, edges, pieces):
+        self.edges = np.asarray(edges, dtype=float)  # Ends of the adjacent spot intervals
+        self.pieces = pieces  # Chebyshev interpolant per interval, None where it is priced directly
+        self.breaks = self.edges[1:-1]
+        self.lower = self.edges[0]
+        self.upper = self.edges[-1]
+
+    @classmethod
+    def build(cls, option, lower, upper, tolerance=1e-4, delta_tolerance=1e-3, gamma_tolerance=1e-3,
+              min_degree=16, max_degree=64, max_splits=4, checks=9):
+        """
+        Interpolate the price of a contract over a spot range.
+
+        Each piece is refined by doubling its degree; a piece that does not reach the
+        tolerance (a kink such as the early exercise boundary) is split in half, up to
+        max_splits times. A piece is only kept once its delta and gamma also match the
+        greeks of the contract at check points between the interpolation nodes; noisy tree
+        or Monte Carlo prices fail that check, and a piece still failing after max_splits
+        is left out so its spots are priced directly.
+
+        :param option: The contract, left unchanged
+        :param lower: Lowest spot of the range
+        :param upper: Highest spot of the range
+        :param tolerance: Target size of the trailing Chebyshev coefficients, in price units
+        :param delta_tolerance: Largest accepted delta error at the check points
+        :param gamma_tolerance: Largest accepted gamma error at the check points
+        :param min_degree: Degree of the first interpolant on each piece
+        :param max_degree: Highest degree on a piece before it is split
+        :param max_splits: How many times a piece may be halved
+        :param checks: Number of check points per piece
+        :return: A ChebyshevSurface
+        """
+        def price(S):
+            return _prices_at(option, S)
+
+        def accurate(piece):
+            # Chebyshev points of another degree, so they fall between the interpolation nodes
+            a, b = piece.domain
+            S = 0.5 * (a + b) - 0.5 * (b - a) * np.cos(np.pi * (np.arange(checks) + 0.5) / checks)
+            return (np.max(np.abs(piece.deriv(1)(S) - _prices_at(option, S, "delta"))) <= delta_tolerance
+                    and np.max(np.abs(piece.deriv(2)(S) - _prices_at(option, S, "gamma"))) <= gamma_tolerance)
+
+        def interpolate(a, b, splits):
+            degree = min_degree
+            while True:
+                piece = Chebyshev.interpolate(price, degree, domain=[a, b])
+                if np.max(np.abs(piece.coef[-3:])) <= tolerance:
+                    if accurate(piece):
+                        return [(b, piece)]
+                    break
+                if degree >= max_degree:
+                    break
+                degree *= 2
+            if splits == 0:
+                return [(b, None)]
+            middle = 0.5 * (a + b)
+            return interpolate(a, middle, splits - 1) + interpolate(middle, b, splits - 1)
+
+        edges = [lower, upper]
+        H = getattr(option, "H", None)
+        if H is not None and lower < H < upper:
+            edges.insert(1, H)
+
+        pieces = []
+        for a, b in zip(edges[:-1], edges[1:]):
+            pieces += interpolate(a, b, max_splits)
+        return cls([lower] + [end for end, _ in pieces], [piece for _, piece in pieces])
+
+    def contains(self, S):
+        # Spots inside the range that fall on an interpolated piece
+        S = np.asarray(S, dtype=float)
+        index = np.searchsorted(self.breaks, S, side="right")
+        fitted = np.array([piece is not None for piece in self.pieces])
+        return (S >= self.lower) & (S <= self.upper) & fitted[index]
+
+    def __call__(self, S, derivative=0):
+        # Value (or its derivative in the spot) at spots on the interpolated pieces
+        S = np.asarray(S, dtype=float)
+        index = np.searchsorted(self.breaks, S, side="right")
+        result = np.full(S.shape, np.nan)
+        for i, piece in enumerate(self.pieces):
+            on_piece = index == i
+            if piece is not None and np.any(on_piece):
+                result[on_piece] = piece.deriv(derivative)(S[on_piece])
+        return result[()] if result.ndim == 0 else result
+
+
+class SurfaceCache:
+    # Measures by the order of the spot derivative that gives them
+    DERIVATIVES = {"value": 0, "delta": 1, "gamma": 2}
+
+    def __init__(self, tolerance=1e-4, max_entries=256, range_factors=(0.1, 3)):
+        self.tolerance = tolerance
+        self.max_entries = max_entries
+        self.range_factors = range_factors  # Spot range as multiples of S0, like the plot range
+        self._surfaces = OrderedDict()
+
+    def surface(self, option):
+        # The surface of a contract, built on first use and kept in LRU order
+        lower, upper = (factor * float(option.S0) for factor in self.range_factors)
+        key = contract_key(option) + (lower, upper)
+        if key in self._surfaces:
+            self._surfaces.move_to_end(key)
+            return self._surfaces[key]
+
+        surface = ChebyshevSurface.build(option, lower, upper, self.tolerance)
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.max_entries:
+            self._surfaces.popitem(last=False)
+        return surface
+
+    def evaluate(self, option, S, measure="value"):
+        """
+        Value, delta or gamma of a contract at the given spot(s).
+
+        Spots outside the surface range, or on a piece the surface could not fit, are
+        priced directly, as are their greeks.
+
+        :param option: The contract
+        :param S: Spot price(s)
+        :param measure: "value", "delta" or "gamma"
+        :return: The measure at each spot
+        """
+        derivative = self.DERIVATIVES[measure]
+        surface = self.surface(option)
+        S = np.asarray(S, dtype=float)
+        flat = S.ravel()
+        inside = surface.contains(flat)
+
+        result = np.empty(flat.shape)
+        result[inside] = surface(flat[inside], derivative)
+        method = "price" if measure == "value" else measure
+        if not np.all(inside):
+            result[~inside] = _prices_at(option, flat[~inside], method)
+        result = result.reshape(S.shape)
+        return result[()] if result.ndim == 0 else result
+
+    def clear(self):
+        self._surfaces.clear()
+
+    def __len__(self):
+        return len(self._surfaces)
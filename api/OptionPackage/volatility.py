@@ -0,0 +1,354 @@
+import threading
+from collections import deque
+
+import numpy as np
+from scipy.optimize import minimize
+
+from .market_data_providers import Bars
+
+
+# Volatility estimators that keep running state, so a new daily (or intraday) bar costs
+# O(1) instead of a pass over the whole history. Each takes the bars one by one through
+# update(); a bar can also replace the last one, for a day that is still trading.
+# The volatilities are annualised with 252 trading days.
+
+TRADING_DAYS = 252
+
+
+class _RollingMean:
+    # Mean of the last window values (all of them without a window) from a running sum
+    def __init__(self, window=None):
+        self.window = window
+        self.values = deque()
+        self.total = 0.0
+
+    def push(self, value):
+        self.values.append(value)
+        self.total += value
+        if self.window is not None and len(self.values) > self.window:
+            self.total -= self.values.popleft()
+
+    def replace_last(self, value):
+        self.total += value - self.values[-1]
+        self.values[-1] = value
+
+    @property
+    def mean(self):
+        return self.total / len(self.values) if self.values else np.nan
+
+
+class VolatilityEstimator:
+    def __init__(self):
+        self.count = 0  # Number of bars seen
+
+    def update(self, open, high, low, close, replace=False):
+        """
+        Take one more bar.
+
+        :param replace: The bar replaces the last one taken, e.g. a newer quote of today
+        """
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def feed(self, bars):
+        # Take a whole Bars history, oldest first
+        for bar in zip(bars.open.tolist(), bars.high.tolist(), bars.low.tolist(), bars.close.tolist()):
+            self.update(*bar)
+        return self
+
+    @property
+    def variance(self):
+        # Daily variance of the log returns
+        raise NotImplementedError("Subclasses should implement this method")
+
+    @property
+    def volatility(self):
+        return float(np.sqrt(self.variance * TRADING_DAYS))
+
+
+class CloseToCloseEstimator(VolatilityEstimator):
+    def __init__(self, window=TRADING_DAYS):
+        # Population variance of the log returns of the last window days, all days with None
+        super().__init__()
+        self._returns = _RollingMean(window)
+        self._squares = _RollingMean(window)
+        self._close = None
+        self._previous_close = None  # Close before the last bar, to redo its return
+
+    @staticmethod
+    def history_window(bars):
+        # The window that covers exactly the returns of a history
+        return max(len(bars.close) - 1, 1)
+
+    def update(self, open, high, low, close, replace=False):
+        if replace and self.count > 0:
+            self._close = self._previous_close
+        else:
+            self.count += 1
+        if self._close is not None:
+            log_return = np.log(close / self._close)
+            if replace and self._returns.values:
+                self._returns.replace_last(log_return)
+                self._squares.replace_last(log_return ** 2)
+            else:
+                self._returns.push(log_return)
+                self._squares.push(log_return ** 2)
+        self._previous_close = self._close
+        self._close = close
+
+    @property
+    def variance(self):
+        mean = self._returns.mean
+        return max(self._squares.mean - mean ** 2, 0.0)
+
+
+class EWMAEstimator(VolatilityEstimator):
+    def __init__(self, decay=0.94):
+        # Exponentially weighted variance of the log returns, RiskMetrics decay by default
+        super().__init__()
+        self.decay = decay
+        self._variance = np.nan
+        self._previous_variance = np.nan
+        self._close = None
+        self._previous_close = None
+
+    def update(self, open, high, low, close, replace=False):
+        if replace and self.count > 0:
+            self._close = self._previous_close
+            self._variance = self._previous_variance
+        else:
+            self.count += 1
+        self._previous_close = self._close
+        self._previous_variance = self._variance
+        if self._close is not None:
+            squared = np.log(close / self._close) ** 2
+            if np.isnan(self._variance):
+                self._variance = squared
+            else:
+                self._variance = self.decay * self._variance + (1 - self.decay) * squared
+        self._close = close
+
+    @property
+    def variance(self):
+        return self._variance
+
+
+class _RangeEstimator(VolatilityEstimator):
+    # Mean of a per-bar variance estimate from the bar's range, over a rolling window
+    def __init__(self, window=TRADING_DAYS):
+        super().__init__()
+        self._terms = _RollingMean(window)
+
+    @staticmethod
+    def history_window(bars):
+        return max(len(bars.close), 1)
+
+    def term(self, open, high, low, close):
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def update(self, open, high, low, close, replace=False):
+        term = self.term(open, high, low, close)
+        if replace and self.count > 0:
+            self._terms.replace_last(term)
+        else:
+            self.count += 1
+            self._terms.push(term)
+
+    @property
+    def variance(self):
+        return self._terms.mean
+
+
+class ParkinsonEstimator(_RangeEstimator):
+    # Parkinson (1980), from the high-low range
+    def term(self, open, high, low, close):
+        return np.log(high / low) ** 2 / (4 * np.log(2))
+
+
+class GarmanKlassEstimator(_RangeEstimator):
+    # Garman and Klass (1980), from the range and the open-to-close move
+    def term(self, open, high, low, close):
+        return 0.5 * np.log(high / low) ** 2 - (2 * np.log(2) - 1) * np.log(close / open) ** 2
+
+
+class GarchEstimator(VolatilityEstimator):
+    def __init__(self, omega, alpha, beta, variance=None):
+        """
+        GARCH(1,1) variance forecast, sigma2[t+1] = omega + alpha r[t]^2 + beta sigma2[t].
+
+        :param variance: The current variance, the long-run one by default
+        """
+        super().__init__()
+        self.omega = omega
+        self.alpha = alpha
+        self.beta = beta
+        self.long_run_variance = omega / (1 - alpha - beta)
+        self._variance = self.long_run_variance if variance is None else variance
+        self._previous_variance = self._variance
+        self._close = None
+        self._previous_close = None
+
+    @classmethod
+    def fit(cls, bars):
+        """
+        Fit the parameters to a history by Gaussian maximum likelihood.
+
+        :param bars: Bars of the history, at least a few dozen days
+        :return: A GarchEstimator fitted and fed with the history
+        """
+        returns = np.diff(np.log(bars.close))
+        sample_variance = returns.var()
+
+        def negative_log_likelihood(params):
+            omega, alpha, beta = params
+            variance = np.empty(len(returns))
+            variance[0] = sample_variance
+            for t in range(1, len(returns)):
+                variance[t] = omega + alpha * returns[t - 1] ** 2 + beta * variance[t - 1]
+            return 0.5 * np.sum(np.log(variance) + returns ** 2 / variance)
+
+        start = (0.05 * sample_variance, 0.05, 0.9)
+        result = minimize(negative_log_likelihood, start, method="L-BFGS-B",
+                          bounds=((1e-12, None), (0.0, 1.0), (0.0, 1.0)))
+        omega, alpha, beta = result.x
+        if alpha + beta >= 0.999:
+            # No stationary fit, keep the persistence just below one
+            scale = 0.999 / (alpha + beta)
+            alpha, beta = alpha * scale, beta * scale
+        return cls(omega, alpha, beta, variance=sample_variance).feed(bars)
+
+    def update(self, open, high, low, close, replace=False):
+        if replace and self.count > 0:
+            self._close = self._previous_close
+            self._variance = self._previous_variance
+        else:
+            self.count += 1
+        self._previous_close = self._close
+        self._previous_variance = self._variance
+        if self._close is not None:
+            log_return = np.log(close / self._close)
+            self._variance = self.omega + self.alpha * log_return ** 2 + self.beta * self._variance
+        self._close = close
+
+    @property
+    def variance(self):
+        return self._variance
+
+
+ESTIMATORS = {
+    "close-to-close": CloseToCloseEstimator,
+    "ewma": EWMAEstimator,
+    "parkinson": ParkinsonEstimator,
+    "garman-klass": GarmanKlassEstimator,
+    "garch": GarchEstimator,  # Fitted to the history, see GarchEstimator.fit
+}
+
+
+def _bars_of(history):
+    # The OHLC bars of a PriceHistory; one built from closes only gets a flat range per day
+    if history.bars is not None:
+        return history.bars
+    closes = history.closes
+    return Bars(np.arange(len(closes)).astype("datetime64[D]"), closes, closes, closes, closes)
+
+
+class VolatilityService:
+    def __init__(self, method="close-to-close", **settings):
+        """
+        Volatility of each ticker from estimators kept per ticker and advanced bar by bar.
+
+        :param method: Default estimator, one of ESTIMATORS
+        :param settings: Settings of the default estimator, e.g. window or decay
+        """
+        if method not in ESTIMATORS:
+            raise ValueError("Invalid volatility estimator")
+        self.method = method
+        self.settings = settings
+        self._estimators = {}  # (ticker, method) -> [estimator, day of its last bar]
+        self._lock = threading.Lock()
+        # Optional tier shared with the other worker processes, with get_volatility and
+        # put_volatility; a volatility one of them estimated is not estimated again
+        self.shared = None
+        self._published = {}  # (ticker, method) -> last day published to the shared tier
+
+    def _build(self, method, bars):
+        if method == "garch":
+            return GarchEstimator.fit(bars)
+        estimator_class = ESTIMATORS[method]
+        settings = dict(self.settings) if method == self.method else {}
+        if hasattr(estimator_class, "history_window") and "window" not in settings:
+            # The window is the history the estimator starts from, so as later histories
+            # roll forward it keeps the volatility over the same number of days
+            settings["window"] = estimator_class.history_window(bars)
+        return estimator_class(**settings).feed(bars)
+
+    def estimator(self, history, method=None):
+        """
+        The estimator of a ticker, advanced to the last bar of its history.
+
+        Only the bars after the last one the estimator took are fed to it, a newer bar of
+        that same day replaces it; other histories (e.g. shorter ones) rebuild it.
+
+        :param history: A PriceHistory of the ticker
+        :param method: One of ESTIMATORS, the service default by default
+        :return: The VolatilityEstimator
+        """
+        method = method or self.method
+        bars = _bars_of(history)
+        key = (history.ticker, method)
+        with self._lock:
+            entry = self._estimators.get(key)
+            if entry is None or len(bars.dates) == 0 or bars.dates[0] > entry[1] or entry[1] > bars.dates[-1]:
+                entry = self._estimators[key] = [self._build(method, bars), bars.dates[-1]]
+                return entry[0]
+
+            estimator, last = entry
+            start = np.searchsorted(bars.dates, last)
+            for i in range(start, len(bars.dates)):
+                bar = (bars.open[i], bars.high[i], bars.low[i], bars.close[i])
+                estimator.update(*bar, replace=bars.dates[i] == last)
+            entry[1] = bars.dates[-1]
+            return estimator
+
+    def volatility(self, history, method=None):
+        # Annualised volatility of the ticker of a PriceHistory
+        method = method or self.method
+        if self.shared is None:
+            return self.estimator(history, method).volatility
+
+        key = (history.ticker, method)
+        day = _bars_of(history).dates[-1]
+        name = method if method != self.method or not self.settings else f"{method}{sorted(self.settings.items())}"
+        if key not in self._estimators:
+            volatility = self.shared.get_volatility(history.ticker, name, day)
+            if volatility is not None:
+                return volatility
+        volatility = self.estimator(history, method).volatility
+        if self._published.get(key) != day:
+            self.shared.put_volatility(history.ticker, name, day, volatility)
+            self._published[key] = day
+        return volatility
+
+    def update(self, ticker, date, open, high, low, close, method=None):
+        """
+        Feed a new bar to an estimator that exists already, e.g. a live quote of today.
+
+        :param date: Day of the bar, a bar of the last day taken replaces it
+        :return: The updated annualised volatility
+        """
+        method = method or self.method
+        date = np.datetime64(date, "D")
+        with self._lock:
+            estimator, last = self._estimators[(ticker, method)]
+            if date < last:
+                raise ValueError("Bars must be fed in date order")
+            estimator.update(open, high, low, close, replace=date == last)
+            self._estimators[(ticker, method)][1] = date
+            return estimator.volatility
+
+    def clear(self):
+        with self._lock:
+            self._estimators.clear()
+
+
+# The estimators shared by the whole process
+volatility_service = VolatilityService()
@@ -1,14 +1,37 @@
-from .OptionPackage.OptionPortfolioClass import OptionPortfolio
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 
-# In this file we store some global variables
+# In this file we keep the state of the request being handled
 
 
-# The portfolio
+# The portfolio and the plots that might be generated by the GPT, per request. They live
+# in a context variable, so overlapping requests on one worker each see their own, and the
+# tools running in worker threads (asyncio.to_thread copies the context) see the one of
+# the request that called them.
 
-portfolio = None
+class RequestContext:
+    __slots__ = ("portfolio", "plots")
 
+    def __init__(self, portfolio):
+        self.portfolio = portfolio
+        self.plots = []
 
-# The plot that might be generated by the GPT
 
-plots = []
\ No newline at end of file
+_request_context = ContextVar("request_context")
+
+
+def request_context():
+    # The context of the current request, a LookupError outside of one
+    return _request_context.get()
+
+
+@contextmanager
+def use_request_context(portfolio):
+    # Handle a request on the given portfolio, with no plots yet
+    context = RequestContext(portfolio)
+    token = _request_context.set(context)
+    try:
+        yield context
+    finally:
+        _request_context.reset(token)
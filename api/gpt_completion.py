@@ -1,9 +1,11 @@
+import asyncio
 import json
 from openai import OpenAI, AsyncOpenAI
 from tenacity import retry, wait_random_exponential, stop_after_attempt
 from dotenv import load_dotenv
 import os
 from .gpt_tools import *
+from .OptionPackage.market_data import fetch_histories
 
 load_dotenv()  # This loads the environment variables from the .env file
 
@@ -53,6 +55,10 @@ async def gpt_completion(messages, tools):
 
   if(assistant_message.tool_calls):
 
+    # Download the data of every ticker the tools will use in one batch, off the event loop
+    await fetch_histories(json.loads(tool_call.function.arguments).get("underlying_ticker")
+                          for tool_call in assistant_message.tool_calls)
+
     for tool_call in assistant_message.tool_calls:
 
 
@@ -88,7 +94,12 @@ async def gpt_completion(messages, tools):
         print("Called function:", function_called.name)
         print("With arguements")
         print(function_args)
-        content = fuction_to_call(*list(function_args .values()))
+        # Tools price options and may still wait on data, so they run in a worker thread.
+        # A ticker without market data is reported back to the model
+        try:
+            content = await asyncio.to_thread(fuction_to_call, *list(function_args .values()))
+        except ValueError as error:
+            content = f"Error: {error}"
         print("Received content"+content)
 
        
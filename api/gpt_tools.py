@@ -1,8 +1,6 @@
 import json
 import numpy as np
-from .OptionPackage.option_definitions import VanillaOption
-from .OptionPackage.OptionPositionClass import OptionPosition
-from . import config
+from .config import request_context
 
 response_json = {"message":None, "plot": None}
 
@@ -33,7 +31,7 @@ def add_option_position_to_portfolio(option_flavour, option_type, strike_price,
     }
     
 
-    response = config.portfolio.add_position_dict(pos_dict)
+    response = request_context().portfolio.add_position_dict(pos_dict)
     return response
     
 
@@ -47,11 +45,11 @@ def get_portfolio_delta():
     """
 
     # Plot the value over S0
-    plot_json = config.portfolio.plot_delta(return_html = True)
+    plot_json = request_context().portfolio.plot_delta(return_html = True)
 
-    config.plots.append(plot_json)
+    request_context().plots.append(plot_json)
 
-    return str(config.portfolio.total_delta())
+    return str(request_context().portfolio.total_delta())
 
 
 
@@ -64,12 +62,12 @@ def get_portfolio_gamma():
     """
 
     # Plot the value over S0
-    plot_json = config.portfolio.plot_gamma(return_html = True)
+    plot_json = request_context().portfolio.plot_gamma(return_html = True)
 
-    config.plots.append(plot_json)
+    request_context().plots.append(plot_json)
 
 
-    return str(config.portfolio.total_gamma())
+    return str(request_context().portfolio.total_gamma())
 
 
 
@@ -80,7 +78,7 @@ def get_portfolio_value():
     :param portfolio: The OptionPortfolio instance for which the value will be calculated
     :return: The calculated value
     """
-    return str(config.portfolio.total_value())
+    return str(request_context().portfolio.total_value())
 
 
 
@@ -93,225 +91,104 @@ def get_portfolio_value_plot():
     """
 
     # Plot the value over S0
-    plot_json = config.portfolio.plot_value(return_html = True)
+    plot_json = request_context().portfolio.plot_value(return_html = True)
 
-    config.plots.append(plot_json)
+    request_context().plots.append(plot_json)
 
     return "The value plot of the portfolio is shown to the screen for the user"
     
 
 def get_portfolio_description():
-    return config.portfolio.describe_portfolio()
+    return request_context().portfolio.describe_portfolio()
 
 
 
 
 # Functions to add spreads
 
-def add_straddle_position_to_portfolio(strike_price, quantity, position, underlying_ticker):
-        if(position == 'long'):
-             call_position_direction = 'long'
-             put_position_direction = 'long'
-        
-        else:
-             call_position_direction = 'short'
-             put_position_direction = 'short'
-
-
-        call_pos_dict = {
+def _add_vanilla_legs(legs, underlying_ticker):
+    # Every leg goes through add_position_dict, like a single position would,
+    # legs are (option_type, strike_price, quantity, position). A strategy goes in whole:
+    # when a leg fails the legs already added are taken out again and its error returned
+    portfolio = request_context().portfolio
+    added = []
+    for option_type, strike_price, quantity, position in legs:
+        count = len(portfolio.positions)
+        message = portfolio.add_position_dict({
             'option_flavour': "vanilla",
-            'option_type': "call",
+            'option_type': option_type,
             'strike_price': strike_price,
             'quantity': quantity,
-            'position': call_position_direction,
+            'position': position,
             'underlying_ticker': underlying_ticker,
-            "barrier_level":None,
-            "barrier_type":None,
-        }
+            "barrier_level": None,
+            "barrier_type": None,
+        })
+        if len(portfolio.positions) == count:
+            for leg in added:
+                portfolio.remove_position(leg)
+            return message
+        added.append(portfolio.positions[-1])
+    return None
 
-        put_pos_dict = {
-            'option_flavour': "vanilla",
-            'option_type': "put",
-            'strike_price': strike_price,
-            'quantity': quantity,
-            'position': call_position_direction,
-            'underlying_ticker': underlying_ticker,
-            "barrier_level":None,
-            "barrier_type":None,
-        }
 
-        config.portfolio.dictionary.append(call_pos_dict)
-        config.portfolio.dictionary.append(put_pos_dict)
-             
-        # Create a call option
-        call_option = VanillaOption(S0=None, K=strike_price, T=1, r=0.05, sigma=None, option_type='call', ticker=underlying_ticker)
-        call_position = OptionPosition(call_option, call_position_direction, quantity)
-        config.portfolio.add_position(call_position)
-        
-        # Create a put option
-        put_option = VanillaOption(S0=None, K=strike_price, T=1, r=0.05, sigma=None, option_type='put', ticker=underlying_ticker)
-        put_position = OptionPosition(put_option, put_position_direction, quantity)
-        config.portfolio.add_position(put_position)
+def add_straddle_position_to_portfolio(strike_price, quantity, position, underlying_ticker):
+        direction = 'long' if position == 'long' else 'short'
+        error = _add_vanilla_legs([("call", strike_price, quantity, direction),
+                                   ("put", strike_price, quantity, direction)], underlying_ticker)
+        if error:
+            return f"The straddle was not added: {error}"
 
         # Logging message
         return f"Added {quantity} {position} straddle position with {underlying_ticker} underlying and strike {strike_price} to the portfolio."
 
 
-def add_strangle_position_to_portfolio(higher_strike_price, lower_strike_price, quantity, position, underlying_ticker):
-    if position == 'long':
-        call_position_direction = 'long'
-        put_position_direction = 'long'
-    else:
-        call_position_direction = 'short'
-        put_position_direction = 'short'
-
-
-    call_pos_dict = {
-        'option_flavour': "vanilla",
-        'option_type': "call",
-        'strike_price': higher_strike_price,
-        'quantity': quantity,
-        'position': call_position_direction,
-        'underlying_ticker': underlying_ticker,
-        "barrier_level":None,
-        "barrier_type":None,
-    }
-
-    put_pos_dict = {
-        'option_flavour': "vanilla",
-        'option_type': "put",
-        'strike_price': lower_strike_price,
-        'quantity': quantity,
-        'position': call_position_direction,
-        'underlying_ticker': underlying_ticker,
-        "barrier_level":None,
-        "barrier_type":None,
-    }
-
-    config.portfolio.dictionary.append(call_pos_dict)
-    config.portfolio.dictionary.append(put_pos_dict)
-
 
-    # Create a call option at a higher strike price
-    call_option = VanillaOption(S0=None, K=higher_strike_price, T=1, r=0.05, sigma=None, option_type='call', ticker=underlying_ticker)
-    call_position = OptionPosition(call_option, call_position_direction, quantity)
-    config.portfolio.add_position(call_position)
-    
-    # Create a put option at a lower strike price
-    put_option = VanillaOption(S0=None, K=lower_strike_price, T=1, r=0.05, sigma=None, option_type='put', ticker=underlying_ticker)
-    put_position = OptionPosition(put_option, put_position_direction, quantity)
-    config.portfolio.add_position(put_position)
+def add_strangle_position_to_portfolio(higher_strike_price, lower_strike_price, quantity, position, underlying_ticker):
+    direction = 'long' if position == 'long' else 'short'
+    # Call at the higher strike, put at the lower strike
+    error = _add_vanilla_legs([("call", higher_strike_price, quantity, direction),
+                               ("put", lower_strike_price, quantity, direction)], underlying_ticker)
+    if error:
+        return f"The strangle was not added: {error}"
 
     # Logging message
     return f"Added {quantity} {position} strangle position with {underlying_ticker} underlying and lower strike of {lower_strike_price} and higher strike of {higher_strike_price} to the portfolio."
 
 
-def add_call_spread_to_portfolio(lower_strike_price, higher_strike_price, quantity, spread_type, underlying_ticker):
+def _spread_strikes(lower_strike_price, higher_strike_price, spread_type):
+    # The long and short strikes of a bull or bear spread
     if spread_type == 'bull':
-        long_strike_price = lower_strike_price
-        short_strike_price = higher_strike_price
-        long_position_direction = 'long'
-        short_position_direction = 'short'
+        return lower_strike_price, higher_strike_price
     elif spread_type == 'bear':
-        long_strike_price = higher_strike_price
-        short_strike_price = lower_strike_price
-        long_position_direction = 'long'
-        short_position_direction = 'short'
-    else:
-        return "Invalid spread type. Choose 'bull' or 'bear'."
-
-    # Dictionary for long position
-    long_pos_dict = {
-        'option_flavour': "vanilla",
-        'option_type': "call",
-        'strike_price': long_strike_price,
-        'quantity': quantity,
-        'position': long_position_direction,
-        'underlying_ticker': underlying_ticker,
-        "barrier_level": None,
-        "barrier_type": None,
-    }
-
-    # Dictionary for short position
-    short_pos_dict = {
-        'option_flavour': "vanilla",
-        'option_type': "call",
-        'strike_price': short_strike_price,
-        'quantity': quantity,
-        'position': short_position_direction,
-        'underlying_ticker': underlying_ticker,
-        "barrier_level": None,
-        "barrier_type": None,
-    }
+        return higher_strike_price, lower_strike_price
+    return None
 
-    # Adding option dictionaries to the portfolio list
-    config.portfolio.dictionary.append(long_pos_dict)
-    config.portfolio.dictionary.append(short_pos_dict)
 
-    # Create long position call option
-    long_call_option = VanillaOption(S0=None, K=long_strike_price, T=1, r=0.05, sigma=None, option_type='call', ticker=underlying_ticker)
-    long_call_position = OptionPosition(long_call_option, long_position_direction, quantity)
-    config.portfolio.add_position(long_call_position)
+def add_call_spread_to_portfolio(lower_strike_price, higher_strike_price, quantity, spread_type, underlying_ticker):
+    strikes = _spread_strikes(lower_strike_price, higher_strike_price, spread_type)
+    if strikes is None:
+        return "Invalid spread type. Choose 'bull' or 'bear'."
+    long_strike_price, short_strike_price = strikes
 
-    # Create short position call option
-    short_call_option = VanillaOption(S0=None, K=short_strike_price, T=1, r=0.05, sigma=None, option_type='call', ticker=underlying_ticker)
-    short_call_position = OptionPosition(short_call_option, short_position_direction, quantity)
-    config.portfolio.add_position(short_call_position)
+    error = _add_vanilla_legs([("call", long_strike_price, quantity, 'long'),
+                               ("call", short_strike_price, quantity, 'short')], underlying_ticker)
+    if error:
+        return f"The call spread was not added: {error}"
 
     return f"Added {quantity} {spread_type} call spread with {underlying_ticker} underlying, lower strike of {lower_strike_price}, and higher strike of {higher_strike_price} to the portfolio."
 
 
 def add_put_spread_to_portfolio(lower_strike_price, higher_strike_price, quantity, spread_type, underlying_ticker):
-    if spread_type == 'bull':
-        long_strike_price = lower_strike_price
-        short_strike_price = higher_strike_price
-        long_position_direction = 'long'
-        short_position_direction = 'short'
-    elif spread_type == 'bear':
-        long_strike_price = higher_strike_price
-        short_strike_price = lower_strike_price
-        long_position_direction = 'long'
-        short_position_direction = 'short'
-    else:
+    strikes = _spread_strikes(lower_strike_price, higher_strike_price, spread_type)
+    if strikes is None:
         return "Invalid spread type. Choose 'bull' or 'bear'."
+    long_strike_price, short_strike_price = strikes
 
-    # Dictionary for long position
-    long_pos_dict = {
-        'option_flavour': "vanilla",
-        'option_type': "put",
-        'strike_price': long_strike_price,
-        'quantity': quantity,
-        'position': long_position_direction,
-        'underlying_ticker': underlying_ticker,
-        "barrier_level": None,
-        "barrier_type": None,
-    }
-
-    # Dictionary for short position
-    short_pos_dict = {
-        'option_flavour': "vanilla",
-        'option_type': "put",
-        'strike_price': short_strike_price,
-        'quantity': quantity,
-        'position': short_position_direction,
-        'underlying_ticker': underlying_ticker,
-        "barrier_level": None,
-        "barrier_type": None,
-    }
-
-    # Adding option dictionaries to the portfolio list
-    config.portfolio.dictionary.append(long_pos_dict)
-    config.portfolio.dictionary.append(short_pos_dict)
-
-    # Create long position put option
-    long_put_option = VanillaOption(S0=None, K=long_strike_price, T=1, r=0.05, sigma=None, option_type='put', ticker=underlying_ticker)
-    long_put_position = OptionPosition(long_put_option, long_position_direction, quantity)
-    config.portfolio.add_position(long_put_position)
-
-    # Create short position put option
-    short_put_option = VanillaOption(S0=None, K=short_strike_price, T=1, r=0.05, sigma=None, option_type='put', ticker=underlying_ticker)
-    short_put_position = OptionPosition(short_put_option, short_position_direction, quantity)
-    config.portfolio.add_position(short_put_position)
+    error = _add_vanilla_legs([("put", long_strike_price, quantity, 'long'),
+                               ("put", short_strike_price, quantity, 'short')], underlying_ticker)
+    if error:
+        return f"The put spread was not added: {error}"
 
     return f"Added {quantity} {spread_type} put spread with {underlying_ticker} underlying, lower strike of {lower_strike_price}, and higher strike of {higher_strike_price} to the portfolio."
 
@@ -326,63 +203,18 @@ def add_butterfly_to_portfolio(lower_strike, middle_strike, higher_strike, quant
     outer_position = 'long' if position == 'long' else 'short'
     middle_position = 'short' if position == 'long' else 'long'
 
-    # Lower strike position
-    lower_dict = {
-        'option_flavour': "vanilla",
-        'option_type': option_type,
-        'strike_price': lower_strike,
-        'quantity': quantity,
-        'position': outer_position,
-        'underlying_ticker': underlying_ticker,
-        "barrier_level": None,
-        "barrier_type": None,
-    }
-
-    # Middle strike position (double quantity)
-    middle_dict = {
-        'option_flavour': "vanilla",
-        'option_type': option_type,
-        'strike_price': middle_strike,
-        'quantity': 2 * quantity,
-        'position': middle_position,
-        'underlying_ticker': underlying_ticker,
-        "barrier_level": None,
-        "barrier_type": None,
-    }
-
-    # Higher strike position
-    higher_dict = {
-        'option_flavour': "vanilla",
-        'option_type': option_type,
-        'strike_price': higher_strike,
-        'quantity': quantity,
-        'position': outer_position,
-        'underlying_ticker': underlying_ticker,
-        "barrier_level": None,
-        "barrier_type": None,
-    }
-
-    # Adding option dictionaries to the portfolio list
-    config.portfolio.dictionary.extend([lower_dict, middle_dict, higher_dict])
-
-    # Create and add options to the portfolio
-    lower_option = VanillaOption(S0=None, K=lower_strike, T=1, r=0.05, sigma=None, option_type=option_type, ticker=underlying_ticker)
-    lower_position = OptionPosition(lower_option, outer_position, quantity)
-    config.portfolio.add_position(lower_position)
-
-    middle_option = VanillaOption(S0=None, K=middle_strike, T=1, r=0.05, sigma=None, option_type=option_type, ticker=underlying_ticker)
-    middle_position = OptionPosition(middle_option, middle_position, 2 * quantity)
-    config.portfolio.add_position(middle_position)
-
-    higher_option = VanillaOption(S0=None, K=higher_strike, T=1, r=0.05, sigma=None, option_type=option_type, ticker=underlying_ticker)
-    higher_position = OptionPosition(higher_option, outer_position, quantity)
-    config.portfolio.add_position(higher_position)
+    # The middle strike has double quantity
+    error = _add_vanilla_legs([(option_type, lower_strike, quantity, outer_position),
+                               (option_type, middle_strike, 2 * quantity, middle_position),
+                               (option_type, higher_strike, quantity, outer_position)], underlying_ticker)
+    if error:
+        return f"The butterfly was not added: {error}"
 
     return f"Added {quantity} {position} {option_type} butterfly spread with {underlying_ticker} underlying, strikes at {lower_strike}, {middle_strike}, and {higher_strike} to the portfolio."
 
 
 def empty_portfolio():
-     return config.portfolio.empty_portfolio()
+     return request_context().portfolio.empty_portfolio()
 
 
 # Now define the tool guidelines to be used by the GPT agent
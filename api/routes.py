@@ -1,8 +1,11 @@
 from quart import Quart, request, jsonify, Blueprint
 from quart_cors import cors
+import asyncio
 import json
-from . import config
+from .config import use_request_context
 from .OptionPackage.OptionPortfolioClass import OptionPortfolio
+from .OptionPackage.market_data import market_data_cache
+from .session_store import sessions, apply_patch
 from .gpt_completion import gpt_completion
 from .gpt_tools import tools
 
@@ -23,22 +26,54 @@ async def deltagpt_api():
     # Fetch the data from the request
     data = await request.get_json()
     messages = data.get('messages', [])
-    portfolio_json = data.get('portfolio', [])
+    session_id = data.get('session_id')
+    version = data.get('version')
     message = messages[-1]["content"]
 
-    # Initialize the portfolio and reset the plot
-    config.portfolio = OptionPortfolio(portfolio_json)
-    config.plots = []
+    # A client with a live session sends the version it has and a patch of its changes,
+    # otherwise the whole portfolio starts a new session. The store may read and write
+    # the shared SQLite tier, so its calls run off the event loop
+    session = await asyncio.to_thread(sessions.get, session_id) if session_id else None
+    if session is None or version != session.version:
+        if 'portfolio' not in data:
+            return jsonify(error="Unknown session or version, send the whole portfolio"), 409
+        session = await asyncio.to_thread(sessions.create, data['portfolio'])
+        version = session.version
+        patch = []
+    else:
+        patch = data.get('patch', [])
 
-    # Fetch the response
-    response_text = await gpt_completion(messages, tools)
-    messages.append({"role": "system", "content": response_text})
+    async with session.lock:
+        if version != session.version:
+            # Another turn of this session finished first
+            return jsonify(error="Outdated version, send the whole portfolio"), 409
+        try:
+            apply_patch(session.portfolio, patch)
+        except (KeyError, ValueError) as error:
+            return jsonify(error=f"Invalid patch: {error}"), 400
 
-    # Get the updated portfolio json
-    portfolio_response = config.portfolio.dictionary
+        # Handle the turn on the session portfolio, with no plots yet
+        with use_request_context(session.portfolio) as context:
+            await context.portfolio.refresh_market()
 
-    #return jsonify(text=response_text, messages=messages, portfolio=portfolio_response, plot=json.loads(config.plots) if config.plots else None)
-    return jsonify(text=response_text, messages=messages, portfolio=portfolio_response, plots=config.plots or None)
+            # Fetch the response
+            response_text = await gpt_completion(messages, tools)
+            messages.append({"role": "system", "content": response_text})
+
+            # Get the updated portfolio json
+            portfolio_response = context.portfolio.dictionary
+            plots = context.plots or None
+        await asyncio.to_thread(sessions.update, session)
+
+    #return jsonify(text=response_text, messages=messages, portfolio=portfolio_response, plot=json.loads(plots) if plots else None)
+    return jsonify(text=response_text, messages=messages, portfolio=portfolio_response, plots=plots,
+                   session_id=session.session_id, version=session.version)
+
+
+@main.route('/market_data_stats')
+def market_data_stats():
+    # Hit and miss counters of the market data cache
+    return jsonify(market_data_cache.stats())
 
 
 @main.after_request
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from .OptionPackage.OptionPortfolioClass import OptionPortfolio, position_from_dict
+from .shared_cache import shared_cache
+
+
+# Live portfolios kept between chat turns. A client that holds a session only sends the
+# version it last received and a patch of its own changes, so a turn no longer rebuilds
+# and reprices the whole book. Sessions expire after a while without use, and the least
+# recently used ones are dropped past a count or memory limit. With the shared cache on,
+# every turn is also published there, so the other workers of the host can continue it.
+
+SESSION_TTL = float(os.environ.get("SESSION_TTL", 30 * 60))  # Seconds
+MAX_SESSIONS = int(os.environ.get("SESSION_MAX_COUNT", 1000))
+MAX_SESSION_BYTES = int(os.environ.get("SESSION_MAX_BYTES", 256 * 2 ** 20))
+
+
+class Session:
+    __slots__ = ("session_id", "portfolio", "version", "last_used", "nbytes", "lock")
+
+    def __init__(self, session_id, portfolio):
+        self.session_id = session_id
+        self.portfolio = portfolio
+        self.version = 0  # Bumped at every turn, the client sends back the one it has
+        self.last_used = time.monotonic()
+        self.nbytes = portfolio.nbytes
+        self.lock = asyncio.Lock()  # One turn at a time per session
+
+
+class SessionStore:
+    def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS, max_bytes=MAX_SESSION_BYTES, clock=time.monotonic,
+                 shared=None):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.shared = shared  # Optional SharedCache
+        self._sessions = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def _drop(self, session_id):
+        session = self._sessions.pop(session_id)
+        self._nbytes -= session.nbytes
+
+    def _evict(self):
+        # Expired sessions, then the least recently used ones over the limits; the most
+        # recent session is always kept
+        now = self.clock()
+        for session_id in [key for key, session in self._sessions.items() if now - session.last_used > self.ttl]:
+            self._drop(session_id)
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or self._nbytes > self.max_bytes):
+            self._drop(next(iter(self._sessions)))
+
+    def _add(self, session):
+        session.last_used = self.clock()
+        with self._lock:
+            if session.session_id in self._sessions:
+                self._drop(session.session_id)
+            self._sessions[session.session_id] = session
+            self._nbytes += session.nbytes
+            self._evict()
+        return session
+
+    def get(self, session_id):
+        # The live session, or None if it is unknown or expired
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and self.clock() - session.last_used > self.ttl:
+                self._drop(session_id)
+                session = None
+            if session is not None:
+                session.last_used = self.clock()
+                self._sessions.move_to_end(session_id)
+        if self.shared is None:
+            return session
+
+        stored = self.shared.get_session(session_id)
+        if stored is None or (session is not None and session.version >= stored[0]):
+            return session
+        # A newer turn of the session ran on another worker, continue from it
+        version, positions = stored
+        session = Session(session_id, OptionPortfolio(positions))
+        session.version = version
+        return self._add(session)
+
+    def create(self, positions=None):
+        # A new session around a portfolio built from position dicts
+        session = self._add(Session(uuid.uuid4().hex, OptionPortfolio(positions)))
+        if self.shared is not None:
+            self.shared.put_session(session.session_id, session.version, session.portfolio.dictionary, self.ttl)
+        return session
+
+    def update(self, session):
+        # Record a turn: bump the version and account for the new size of the portfolio
+        with self._lock:
+            session.version += 1
+            session.last_used = self.clock()
+            if session.session_id in self._sessions:
+                nbytes = session.portfolio.nbytes
+                self._nbytes += nbytes - session.nbytes
+                session.nbytes = nbytes
+                self._sessions.move_to_end(session.session_id)
+            self._evict()
+        if self.shared is not None:
+            self.shared.put_session(session.session_id, session.version, session.portfolio.dictionary, self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self._nbytes = 0
+
+
+def apply_patch(portfolio, patch):
+    """
+    Apply a client's changes to a live portfolio, in order.
+
+    Each operation is {"op": "add", "position": {...}} with a position in the dict format
+    of the front end, or {"op": "remove", "index": i} with an index into the positions as
+    they are when the operation runs. The whole patch is checked, and the added positions
+    built, before anything changes.
+
+    :param portfolio: The OptionPortfolio of the session
+    :param patch: List of operations
+    :raises ValueError: On a bad operation or position, with the portfolio unchanged
+    :raises KeyError: On a missing field, with the portfolio unchanged
+    """
+    size = len(portfolio.positions)
+    added = []
+    for operation in patch:
+        op = operation.get("op")
+        if op == "add":
+            added.append(position_from_dict(operation["position"]))
+            size += 1
+        elif op == "remove":
+            if not 0 <= int(operation["index"]) < size:
+                raise ValueError(f"No position at index {operation['index']}")
+            size -= 1
+        else:
+            raise ValueError(f"Unknown patch operation {op}")
+
+    added = iter(added)
+    for operation in patch:
+        if operation["op"] == "add":
+            portfolio.add_position(next(added))
+        else:
+            portfolio.remove_position(portfolio.positions[int(operation["index"])])
+
+
+# The sessions of this process
+sessions = SessionStore(shared=shared_cache)
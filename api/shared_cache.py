@@ -0,0 +1,169 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from .OptionPackage.history_store import ROW
+from .OptionPackage.market_data import DEFAULT_TTL, set_shared_tier
+from .OptionPackage.market_data_providers import Bars
+from .OptionPackage.volatility import volatility_service
+
+
+# Cache tier shared by the worker processes of one host, in a SQLite database in WAL mode
+# so readers never wait on a writer. It holds market snapshots, volatility estimates and
+# serialized session portfolios, so a ticker is fetched once per host rather than once per
+# worker and any worker can pick up any session. Every entry carries a version that only
+# goes up, and entries expire or are evicted least recently used past a size limit.
+# Set SHARED_CACHE_PATH to the database file to turn it on.
+
+SHARED_CACHE_PATH = os.environ.get("SHARED_CACHE_PATH")
+SHARED_CACHE_MAX_BYTES = int(os.environ.get("SHARED_CACHE_MAX_BYTES", 512 * 2 ** 20))
+TOUCH_INTERVAL = 60  # Seconds between updates of the use time of an entry
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+"""
+
+
+class SharedCache:
+    def __init__(self, path, max_bytes=SHARED_CACHE_MAX_BYTES, clock=time.time):
+        """
+        :param path: The database file, created if missing
+        :param max_bytes: Total size of the values past which the least recently used go
+        :param clock: Wall clock shared by the processes, time.time by default
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self._local = threading.local()  # One connection per thread
+        with self._connection() as connection:
+            connection.executescript(SCHEMA)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, namespace, key):
+        """
+        A stored value, if it has not expired.
+
+        :return: The version and the value (bytes), or None
+        """
+        connection = self._connection()
+        now = self.clock()
+        row = connection.execute(
+            "SELECT version, value, last_used FROM entries WHERE namespace = ? AND key = ? AND expires > ?",
+            (namespace, key, now)).fetchone()
+        if row is None:
+            return None
+        if now - row[2] > TOUCH_INTERVAL:
+            # Reads only write their use time now and then, to keep them off the write lock
+            connection.execute("UPDATE entries SET last_used = ? WHERE namespace = ? AND key = ?", (now, namespace, key))
+        return row[0], bytes(row[1])
+
+    def put(self, namespace, key, value, ttl, version=None):
+        """
+        Store a value, unless a newer version of it is stored already.
+
+        :param value: The value, as bytes
+        :param ttl: Seconds the value stays valid
+        :param version: The version of the value, one more than the stored one by default
+        :return: The stored version, or None if a newer one was there
+        """
+        connection = self._connection()
+        now = self.clock()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT version FROM entries WHERE namespace = ? AND key = ?",
+                                     (namespace, key)).fetchone()
+            if version is None:
+                version = 1 if row is None else row[0] + 1
+            elif row is not None and row[0] >= version:
+                return None
+            connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (namespace, key, version, value, len(value), now + ttl, now))
+            self._evict(connection, now)
+        return version
+
+    def delete(self, namespace, key):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def _evict(self, connection, now):
+        # Expired entries, then the least recently used ones while over the size limit
+        connection.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+        excess = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0] - self.max_bytes
+        if excess > 0:
+            connection.execute("""
+                DELETE FROM entries WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, SUM(size) OVER (ORDER BY last_used, rowid) - size AS freed_before FROM entries
+                    ) WHERE freed_before < ?
+                )""", (excess,))
+
+    def stats(self):
+        rows = self._connection().execute(
+            "SELECT namespace, COUNT(*), COALESCE(SUM(size), 0) FROM entries GROUP BY namespace").fetchall()
+        return {namespace: {"entries": count, "bytes": size} for namespace, count, size in rows}
+
+    # Market snapshots, as the shared tier of market_data
+
+    def get_bars(self, tickers, period):
+        bars = {}
+        for ticker in tickers:
+            entry = self.get("bars", f"{ticker}:{period}")
+            if entry is not None:
+                rows = np.frombuffer(entry[1], dtype=ROW)
+                bars[ticker] = Bars(rows["date"].astype("datetime64[D]"), *(rows[field].copy() for field in ROW.names[1:]))
+        return bars
+
+    def put_bars(self, bars, period, ttl=DEFAULT_TTL):
+        for ticker, ticker_bars in bars.items():
+            rows = np.empty(len(ticker_bars.close), dtype=ROW)
+            rows["date"] = ticker_bars.dates.astype("datetime64[D]").astype("int64")
+            for field in ROW.names[1:]:
+                rows[field] = getattr(ticker_bars, field)
+            self.put("bars", f"{ticker}:{period}", rows.tobytes(), ttl)
+
+    # Volatility estimates, as the shared tier of the volatility service
+
+    def get_volatility(self, ticker, method, day):
+        entry = self.get("volatility", f"{ticker}:{method}:{day}")
+        return None if entry is None else json.loads(entry[1])
+
+    def put_volatility(self, ticker, method, day, volatility, ttl=DEFAULT_TTL):
+        self.put("volatility", f"{ticker}:{method}:{day}", json.dumps(volatility).encode(), ttl)
+
+    # Session portfolios, as position dicts with the session version
+
+    def get_session(self, session_id):
+        entry = self.get("session", session_id)
+        return None if entry is None else (entry[0], json.loads(entry[1]))
+
+    def put_session(self, session_id, version, positions, ttl):
+        return self.put("session", session_id, json.dumps(positions).encode(), ttl, version=version)
+
+
+# The tier of this host, None when SHARED_CACHE_PATH is not set
+shared_cache = SharedCache(SHARED_CACHE_PATH) if SHARED_CACHE_PATH else None
+if shared_cache is not None:
+    set_shared_tier(shared_cache)
+    volatility_service.shared = shared_cache
@@ -0,0 +1,62 @@
+"""
+Memory per leg of a book of vanilla positions on one ticker.
+
+Builds books of 10k and 100k legs with tracemalloc running and reports the bytes
+allocated per leg: the slotted options sharing one price history, and for comparison
+the same legs each holding a private copy of a year of closes, as every option did
+when it downloaded its own history.
+
+Run from the repository root:  python benchmarks/leg_memory.py
+"""
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+
+# Import the option package directly, without the web app around it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+from OptionPackage.market_data import PriceHistory, register_history  # noqa: E402
+from OptionPackage.option_definitions import VanillaOption  # noqa: E402
+from OptionPackage.OptionPositionClass import OptionPosition  # noqa: E402
+
+TICKER = "BENCH"
+SIZES = (10_000, 100_000)
+
+
+def build_book(n_legs, private_history=False):
+    strikes = np.linspace(50, 150, 101)
+    book = []
+    for i in range(n_legs):
+        option = VanillaOption(None, float(strikes[i % len(strikes)]), 1, 0.05, None, "call", ticker=TICKER)
+        if private_history:
+            option.history = PriceHistory(TICKER, option.history.closes.copy())
+        book.append(OptionPosition(option, "long", 1))
+    return book
+
+
+def bytes_per_leg(n_legs, private_history=False):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    book = build_book(n_legs, private_history)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del book
+    return allocated / n_legs
+
+
+def main():
+    closes = 100 * np.exp(np.cumsum(np.random.default_rng(0).normal(0, 0.01, 252)))
+    register_history(TICKER, closes)
+
+    print(f"{'legs':>8}  {'shared history':>16}  {'private history':>16}")
+    for n_legs in SIZES:
+        shared = bytes_per_leg(n_legs)
+        private = bytes_per_leg(n_legs, private_history=True)
+        print(f"{n_legs:>8}  {shared:>12.0f} B/leg  {private:>12.0f} B/leg")
+
+
+if __name__ == "__main__":
+    main()
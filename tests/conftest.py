@@ -0,0 +1,4 @@
+import os
+
+# The api package builds its OpenAI client on import; the tests never call it
+os.environ.setdefault("OPENAI_API_KEY", "test")
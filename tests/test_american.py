@@ -0,0 +1,32 @@
+import numpy as np
+
+from api.OptionPackage.american_approximations import barone_adesi_whaley, bjerksund_stensland
+from api.OptionPackage.black_scholes import black_scholes
+from api.OptionPackage.lattice import binomial_tree
+from api.OptionPackage.option_definitions import AmericanOption
+
+
+def test_closed_forms_at_non_positive_rates():
+    # No early exercise at r = 0, and none for puts below zero; calls below zero follow the tree
+    S = np.array([70.0, 100.0, 130.0])
+    for pricer in (barone_adesi_whaley, bjerksund_stensland):
+        for is_call in (True, False):
+            european = black_scholes(S, 100, 1.5, 0.0, 0.6, is_call)["price"]
+            np.testing.assert_allclose(pricer(S, 100, 1.5, 0.0, 0.6, is_call), european)
+        np.testing.assert_allclose(pricer(S, 100, 1.5, -0.01, 0.6, False),
+                                   black_scholes(S, 100, 1.5, -0.01, 0.6, False)["price"])
+        tree = binomial_tree(S, 100, 1.5, -0.01, 0.6, True, steps=1001, method="leisen-reimer")
+        np.testing.assert_allclose(pricer(S, 100, 1.5, -0.01, 0.6, True), tree, atol=0.01)
+
+
+def test_closed_forms_not_below_european():
+    S, T, r, sigma = 71.0, 1.5, 0.005, 0.6
+    european = black_scholes(S, 100, T, r, sigma, False)["price"]
+    for pricer in (barone_adesi_whaley, bjerksund_stensland):
+        assert pricer(S, 100, T, r, sigma, False) >= european
+
+
+def test_engine_selection_follows_error_bounds():
+    assert AmericanOption.select_engine(100, 0.5) == ("barone-adesi-whaley", None)
+    assert AmericanOption.select_engine(100, 0.25)[0] == "leisen-reimer"
+    assert AmericanOption(100, 100, 1, 0.05, 0.2, "put", engine="bjerksund-stensland").engine == "bjerksund-stensland"
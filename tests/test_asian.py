@@ -0,0 +1,18 @@
+import numpy as np
+
+from api.OptionPackage.option_definitions import AsianOption
+
+# Gamma of the arithmetic Asian call below, from 1.6M pathwise delta differences
+ARITHMETIC_GAMMA = 0.0327
+
+
+def test_arithmetic_gamma_across_seeds():
+    gammas = [AsianOption(100, 100, 1, 0.05, 0.2, "call", asian_type="arithmetic", seed=seed).gamma()
+              for seed in range(5)]
+    assert np.max(np.abs(np.array(gammas) - ARITHMETIC_GAMMA)) < 0.002
+
+
+def test_arithmetic_delta_close_to_geometric():
+    arithmetic = AsianOption(100, 100, 1, 0.05, 0.2, "call", asian_type="arithmetic").delta()
+    geometric = AsianOption(100, 100, 1, 0.05, 0.2, "call", asian_type="geometric").delta()
+    assert 0 < arithmetic - geometric < 0.02
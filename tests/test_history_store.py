@@ -0,0 +1,23 @@
+import os
+
+import numpy as np
+import pytest
+
+from api.OptionPackage.history_store import HistoryStore
+from api.OptionPackage.market_data_providers import MarketDataProvider, make_bars
+
+
+class SteadyProvider(MarketDataProvider):
+    def fetch(self, tickers, period="1y"):
+        dates = np.datetime64("today", "D") - np.arange(30)[::-1]
+        closes = np.linspace(90, 100, 30)
+        return {ticker: make_bars(dates, closes, closes, closes, closes) for ticker in tickers}
+
+
+def test_tickers_stay_in_the_store(tmp_path):
+    store = HistoryStore(str(tmp_path / "store"))
+    bars = store.fetch(SteadyProvider(), ["../escaped", "/abs", "BRK-B", "^GSPC"])
+    assert sorted(bars) == ["BRK-B", "^GSPC"]
+    assert os.listdir(tmp_path) == ["store"]
+    with pytest.raises(ValueError):
+        store.read("../escaped")
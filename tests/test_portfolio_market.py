@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from api.config import use_request_context
+from api.gpt_tools import add_butterfly_to_portfolio, add_straddle_position_to_portfolio
+from api.OptionPackage import market_data
+from api.OptionPackage.OptionPortfolioClass import OptionPortfolio
+from api.OptionPackage.market_data_providers import MarketDataProvider, make_bars
+
+
+class FlakyProvider(MarketDataProvider):
+    # A year of closes for every ticker except those listed as down
+    def __init__(self):
+        self.down = set()
+
+    def fetch(self, tickers, period="1y"):
+        dates = np.datetime64("2024-01-01") + np.arange(252)
+        closes = 100 * np.exp(0.01 * np.sin(np.arange(252)))
+        return {ticker: make_bars(dates, closes, closes, closes, closes) for ticker in tickers if ticker not in self.down}
+
+
+@pytest.fixture
+def provider():
+    previous = market_data.get_provider()
+    flaky = FlakyProvider()
+    market_data.set_provider(flaky)
+    yield flaky
+    market_data.set_provider(previous)
+
+
+def _leg(ticker):
+    return {"option_flavour": "vanilla", "option_type": "call", "strike_price": 100, "quantity": 1,
+            "position": "long", "underlying_ticker": ticker, "barrier_level": None, "barrier_type": None}
+
+
+def test_failed_ticker_is_retried(provider):
+    provider.down.add("DOWN")
+    portfolio = OptionPortfolio([_leg("UP"), _leg("DOWN")])
+    with pytest.raises(ValueError, match="DOWN"):
+        portfolio.total_value()
+
+    provider.down.clear()
+    assert np.isfinite(portfolio.total_value())
+    assert all(position.option.S0 is not None for position in portfolio.positions)
+
+
+def test_eager_add_reports_the_error(provider):
+    provider.down.add("DOWN")
+    portfolio = OptionPortfolio([_leg("UP")])
+    message = portfolio.add_position_dict(_leg("DOWN"))
+    assert "DOWN" in message
+    assert len(portfolio.positions) == 1
+    assert np.isfinite(portfolio.total_value())
+
+
+def test_store_columns_price_the_book(provider):
+    # Vanilla curves and per-ticker sums come off the store columns; they must agree with
+    # pricing each leg on its own, also after a leg moves to a new spot
+    legs = [dict(_leg(ticker), strike_price=K, option_type=kind, position=side, quantity=quantity)
+            for K, kind, ticker, side, quantity in ((90, "call", "A", "long", 2), (110, "put", "B", "short", 1),
+                                                    (90, "call", "A", "short", 1), (100, "put", "C", "long", 3))]
+    portfolio = OptionPortfolio(legs)
+    portfolio.total_value()
+    portfolio.update_market("B", S0=120)
+
+    S = np.linspace(50, 150, 11)
+    curve = portfolio.total_value_at(S)
+    expected = sum(position.evaluate_at(S, ("value",))["value"] for position in portfolio.positions)
+    np.testing.assert_allclose(curve, expected)
+    report = portfolio.risk_by_ticker()
+    assert set(report) == {"A", "B", "C"}
+    assert np.isclose(report["B"]["value"], -portfolio.positions[1].option.price())
+    assert np.isclose(sum(ticker["delta"] for ticker in report.values()), portfolio.total_delta())
+    assert portfolio.S_range()[-1] == 360
+
+
+def test_strategy_goes_in_whole(provider):
+    # A butterfly whose middle strike is rejected leaves none of its legs behind
+    portfolio = OptionPortfolio([_leg("UP")])
+    with use_request_context(portfolio):
+        message = add_butterfly_to_portfolio(90, "mid", 110, 1, "call", "UP")
+        assert message.startswith("The butterfly was not added")
+        assert len(portfolio.positions) == len(portfolio.store) == 1
+
+        provider.down.add("DOWN")
+        assert "DOWN" in add_straddle_position_to_portfolio(100, 1, "long", "DOWN")
+        assert len(portfolio.positions) == 1
+        assert add_straddle_position_to_portfolio(100, 1, "long", "UP").startswith("Added")
+        assert len(portfolio.positions) == 3
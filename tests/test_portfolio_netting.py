@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from api.OptionPackage.OptionPortfolioClass import OptionPortfolio
+from api.OptionPackage.OptionPositionClass import OptionPosition
+from api.OptionPackage.option_definitions import VanillaOption
+
+
+def _call():
+    return VanillaOption(S0=100, K=100, T=1, r=0.05, sigma=0.2, option_type="call")
+
+
+def test_remove_one_of_two_offsetting_legs():
+    # Add A, add -A, remove A: the book is the short leg alone
+    portfolio = OptionPortfolio()
+    long_leg = OptionPosition(_call(), "long", 2)
+    short_leg = OptionPosition(_call(), "short", 2)
+    portfolio.add_position(long_leg)
+    portfolio.add_position(short_leg)
+    assert portfolio.netted_positions() == []
+    assert portfolio.total_value() == 0
+
+    portfolio.remove_position(long_leg)
+    netted = portfolio.netted_positions()
+    assert len(netted) == 1
+    assert netted[0].option is not None
+    assert netted[0].signed_quantity == -2
+
+    S = np.linspace(50, 150, 11)
+    expected = short_leg.evaluate_at(S, ("value", "delta"))
+    np.testing.assert_allclose(portfolio.total_value_at(S), expected["value"])
+    np.testing.assert_allclose(portfolio.total_delta_at(S), expected["delta"])
+    assert np.isclose(portfolio.total_value(), -2 * _call().price())
+
+
+def test_rejected_leg_keeps_book_aligned():
+    portfolio = OptionPortfolio()
+    portfolio.add_position(OptionPosition(_call(), "long", 1))
+    bad = VanillaOption(S0=100, K=100, T=1, r=0.05, sigma=0.2, option_type="CALL")
+    with pytest.raises(ValueError):
+        portfolio.add_position(OptionPosition(bad, "long", 1))
+    assert len(portfolio.positions) == len(portfolio.store) == 1
+    assert len(portfolio.dictionary) == 1
+    portfolio.remove_position(portfolio.positions[0])
+    assert portfolio.positions == [] and len(portfolio.store) == 0
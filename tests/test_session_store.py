@@ -0,0 +1,29 @@
+import pytest
+
+from api.OptionPackage.OptionPortfolioClass import OptionPortfolio
+from api.session_store import apply_patch
+
+
+def _leg(**changes):
+    leg = {"option_flavour": "vanilla", "option_type": "call", "strike_price": 100, "quantity": 1,
+           "position": "long", "underlying_ticker": None, "barrier_level": None, "barrier_type": None}
+    leg.update(changes)
+    return leg
+
+
+@pytest.mark.parametrize("bad", [_leg(option_type="CALL"), _leg(option_flavour="digital"), _leg(position="flat"),
+                                 _leg(strike_price="abc"), _leg(option_flavour="barrier", barrier_type="sideways",
+                                                                barrier_level=90)])
+def test_bad_patch_leaves_portfolio_unchanged(bad):
+    portfolio = OptionPortfolio([_leg(), _leg(strike_price=110)])
+    with pytest.raises(ValueError):
+        apply_patch(portfolio, [{"op": "remove", "index": 0}, {"op": "add", "position": _leg()},
+                                {"op": "add", "position": bad}])
+    assert len(portfolio.positions) == len(portfolio.store) == 2
+    assert [leg["strike_price"] for leg in portfolio.dictionary] == [100, 110]
+
+
+def test_patch_applies_in_order():
+    portfolio = OptionPortfolio([_leg(), _leg(strike_price=110)])
+    apply_patch(portfolio, [{"op": "remove", "index": 0}, {"op": "add", "position": _leg(strike_price=120)}])
+    assert [leg["strike_price"] for leg in portfolio.dictionary] == [110, 120]
@@ -0,0 +1,26 @@
+import numpy as np
+
+from api.OptionPackage.option_definitions import AmericanOption
+from api.OptionPackage.surface_cache import SurfaceCache
+
+
+def test_tree_noise_is_priced_directly():
+    # The CRR prices wobble with the spot, so the fitted greeks near the money fail the
+    # check and those spots come off the tree itself
+    option = AmericanOption(100, 100, 1.0, 0.05, 0.25, 'put', steps=300, engine="crr")
+    cache = SurfaceCache()
+    S = np.linspace(60, 160, 101)
+    direct = option._bumped(S0=S)
+    np.testing.assert_allclose(cache.evaluate(option, S, "delta"), direct.delta(), atol=1e-3)
+    np.testing.assert_allclose(cache.evaluate(option, S, "gamma"), direct.gamma(), atol=1e-3)
+    assert any(piece is None for piece in cache.surface(option).pieces)
+
+
+def test_smooth_prices_are_interpolated():
+    option = AmericanOption(100, 100, 1.0, 0.05, 0.25, 'put', engine="barone-adesi-whaley")
+    cache = SurfaceCache()
+    S = np.linspace(60, 160, 101)
+    direct = option._bumped(S0=S)
+    np.testing.assert_allclose(cache.evaluate(option, S, "gamma"), direct.gamma(), atol=1e-3)
+    surface = cache.surface(option)
+    assert surface.contains(S).mean() > 0.5
@@ -0,0 +1,20 @@
+import numpy as np
+
+from api.OptionPackage.market_data import PriceHistory
+from api.OptionPackage.market_data_providers import Bars
+from api.OptionPackage.volatility import VolatilityService
+
+
+def test_rolling_histories_match_one_year_volatility():
+    # A long-lived service fed a rolling year of bars keeps the volatility of that year
+    rng = np.random.default_rng(1)
+    daily = np.r_[np.full(300, 0.015), np.full(300, 0.035)]
+    close = 100 * np.exp(np.cumsum(rng.normal(0, daily)))
+    dates = np.datetime64("2024-01-01") + np.arange(len(close))
+    service = VolatilityService()
+    for end in range(251, len(close) + 1):
+        window = slice(end - 251, end)
+        bars = Bars(dates[window], close[window], close[window] * 1.01, close[window] * 0.99, close[window])
+        history = PriceHistory("TEST", bars.close, bars)
+        expected = np.std(np.diff(np.log(close[window]))) * np.sqrt(252)
+        assert np.isclose(service.volatility(history), expected, rtol=1e-10)